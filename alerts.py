@@ -0,0 +1,269 @@
+"""Threshold rules evaluated on every refresh, alert transitions delivered
+to a webhook, a file or kept in memory"""
+# -*- coding:utf-8 -*-
+import asyncio
+import collections
+import json
+import time
+
+import httpx
+import yaml
+
+import render
+from changes import SECTIONS
+from selection import Selection
+
+# Rules used when no rules file is configured, conditions use the filter
+# syntax of the storage, health and services routes
+DEFAULT_RULES = {
+    "volume_full": {"endpoint": "volumes", "when": "size_used_p>90",
+                    "clear": "size_used_p<85"},
+    "disk_smart": {"endpoint": "disks", "when": "smart_status!=GOOD"},
+    "disk_hot": {"endpoint": "disks", "when": "temp>50", "clear": "temp<45"},
+    "raid_degraded": {"endpoint": "raids", "when": "raid_state~degraded"},
+    "service_down": {"endpoint": "services",
+                     "when": "enabled=true&running=false"},
+}
+# Fields of the watched endpoints render takes no selection for
+_ENTRY_FIELDS = {
+    "fans": ("id", "fan_speed"),
+    "temps": ("id", "temperature"),
+}
+
+
+class Rule(object):
+    """Condition an entry of an endpoint raises an alert for. Once firing,
+    the alert only resolves when the clear condition matches, or when the
+    condition no longer does if there is none."""
+    def __init__(self, name, endpoint, when, clear=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.when = Selection.from_query(when)
+        self.clear = Selection.from_query(clear) if clear else None
+        if self.when is None or self.when.fields is not None:
+            raise ValueError("Rule %s needs a condition" % name)
+        self.fields = sorted(set(key for key, _, _ in self.when.filters))
+
+    @classmethod
+    def from_config(cls, name, config):
+        """Rule from its entry in a rules file"""
+        return cls(name, config["endpoint"], config["when"],
+                   config.get("clear"))
+
+    def check(self):
+        """Raises ValueError if the endpoint is not watched for alerts or
+        lacks a field of the conditions"""
+        if not any(self.endpoint in endpoints
+                   for endpoints in SECTIONS.values()):
+            raise ValueError("Rule %s: %s is not watched for alerts"
+                             % (self.name, self.endpoint))
+        for selection in (self.when, self.clear):
+            if selection is None:
+                continue
+            try:
+                if self.endpoint in _ENTRY_FIELDS:
+                    selection.check(_ENTRY_FIELDS[self.endpoint])
+                else:
+                    render.check_selection(self.endpoint, selection)
+            except ValueError as err:
+                raise ValueError("Rule %s: %s" % (self.name, err))
+
+    def firing(self, value, firing):
+        """Whether an entry fires, given whether it did before. value(field)
+        reads its fields."""
+        if not firing or self.clear is None:
+            return self.when.matches(value)
+        return not self.clear.matches(value)
+
+
+def load_rules(path=None):
+    """Rules of a YAML file with a rules mapping, the defaults without one.
+    Raises ValueError on malformed conditions or unknown endpoints and
+    fields."""
+    config = DEFAULT_RULES
+    if path:
+        with open(path) as rules_file:
+            config = yaml.safe_load(rules_file)["rules"]
+    rules = [Rule.from_config(name, rule) for name, rule in config.items()]
+    for rule in rules:
+        rule.check()
+    return rules
+
+
+def _reader(endpoint, entity, entry, snapshot):
+    """value(field) of an entry. Volumes, disks and raids are read through
+    the accessors their routes filter on, not the shown strings: "95.0%"
+    or "1.8Tb" would never compare as numbers."""
+    fields = render.SELECTABLE.get(endpoint)
+    if fields is None:
+        return entry.get
+    return lambda field: fields[field][0](snapshot, entity)
+
+
+class FileSink(object):
+    """Appends every transition as a JSON line"""
+    def __init__(self, path):
+        self.name = "file"
+        self._path = path
+
+    async def deliver(self, transitions):
+        """Writes a batch of transitions"""
+        with open(self._path, "a") as alert_file:
+            for transition in transitions:
+                alert_file.write(json.dumps(transition) + "\n")
+
+    async def close(self):
+        """Nothing to close, the file is opened per batch"""
+
+
+class WebhookSink(object):
+    """POSTs every batch of transitions as {"alerts": [...]}"""
+    def __init__(self, url, timeout=10):
+        self.name = "webhook"
+        self._url = url
+        self._timeout = timeout
+        self._client = None
+
+    async def deliver(self, transitions):
+        """Sends a batch of transitions, raises on failure"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self._timeout)
+        response = await self._client.post(self._url,
+                                           json={"alerts": transitions})
+        response.raise_for_status()
+
+    async def close(self):
+        """Closes the http client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def configured_sinks(webhook_url=None, path=None):
+    """Sinks for the configured webhook url and file, either may be unset"""
+    sinks = []
+    if webhook_url:
+        sinks.append(WebhookSink(webhook_url))
+    if path:
+        sinks.append(FileSink(path))
+    return sinks
+
+
+class AlertEngine(object):
+    """Evaluates the rules on the entries the change feeds of the hosts
+    report as changed, so unchanged entries cost nothing.
+
+    Only transitions leave the engine: an entry starting or stopping to
+    fire. They are kept in memory and handed to the sinks by run().
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, rules, sinks=(), recent=100, attempts=3,
+                 retry_delay=5, backlog=1000):
+        self._rules = collections.defaultdict(list)
+        for rule in rules:
+            self._rules[rule.endpoint].append(rule)
+        self._sinks = list(sinks)
+        self._attempts = attempts
+        self._retry_delay = retry_delay
+        self._active = {}
+        self.recent = collections.deque(maxlen=recent)
+        # One outbox per sink so a slow webhook does not hold up the file,
+        # the oldest transitions are dropped while a sink is down
+        self._outboxes = {sink.name: collections.deque(maxlen=backlog)
+                          for sink in self._sinks}
+        self._wakeups = {}
+        self._deliveries = {sink.name: {"delivered": 0, "failed": 0}
+                            for sink in self._sinks}
+    # pylint: enable=too-many-arguments
+
+    @property
+    def sinks(self):
+        """Whether transitions are delivered anywhere"""
+        return bool(self._sinks)
+
+    def watch(self, host, changes):
+        """Evaluates the changed entries of a host's ChangeFeed"""
+        changes.add_listener(
+            lambda endpoint, changed, snapshot: self._evaluate(
+                host, endpoint, changed, snapshot))
+
+    def _evaluate(self, host, endpoint, changed, snapshot):
+        """Records the transitions of the changed entries"""
+        for rule in self._rules.get(endpoint, ()):
+            for entity, entry in changed.items():
+                key = (host, rule.name, entity)
+                firing = key in self._active
+                value = None
+                if entry is not None:
+                    value = _reader(endpoint, entity, entry, snapshot)
+                # Entries that vanished resolve their alerts
+                now_firing = value is not None and rule.firing(value, firing)
+                if now_firing == firing:
+                    continue
+                transition = {
+                    "host": host,
+                    "rule": rule.name,
+                    "endpoint": endpoint,
+                    "entity": entity,
+                    "state": "firing" if now_firing else "resolved",
+                    "values": {field: value(field) if value else None
+                               for field in rule.fields},
+                    "time": time.time(),
+                }
+                if now_firing:
+                    self._active[key] = transition
+                else:
+                    del self._active[key]
+                self.recent.append(transition)
+                for outbox in self._outboxes.values():
+                    outbox.append(transition)
+        for name, wakeup in self._wakeups.items():
+            if self._outboxes[name]:
+                wakeup.set()
+
+    @property
+    def active(self):
+        """Alerts currently firing"""
+        return list(self._active.values())
+
+    def summary(self):
+        """Active alerts, recent transitions and delivery counters"""
+        return {
+            "active": self.active,
+            "recent": list(self.recent),
+            "deliveries": self._deliveries,
+        }
+
+    async def _deliver(self, sink, batch):
+        """Hands a batch to a sink, retrying a few times before dropping"""
+        for attempt in range(1, self._attempts + 1):
+            try:
+                await sink.deliver(batch)
+            except (OSError, httpx.HTTPError):
+                if attempt == self._attempts:
+                    self._deliveries[sink.name]["failed"] += len(batch)
+                    return
+                await asyncio.sleep(self._retry_delay * attempt)
+            else:
+                self._deliveries[sink.name]["delivered"] += len(batch)
+                return
+
+    async def _drain(self, sink):
+        """Delivers the outbox of a sink until cancelled"""
+        outbox = self._outboxes[sink.name]
+        # Created here so it belongs to the running loop
+        wakeup = self._wakeups[sink.name] = asyncio.Event()
+        try:
+            while True:
+                if not outbox:
+                    wakeup.clear()
+                    await wakeup.wait()
+                batch = list(outbox)
+                outbox.clear()
+                await self._deliver(sink, batch)
+        finally:
+            await sink.close()
+
+    async def run(self):
+        """Delivers transitions to every sink until cancelled"""
+        await asyncio.gather(*[self._drain(sink) for sink in self._sinks])
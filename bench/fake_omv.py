@@ -0,0 +1,283 @@
+"""Stand-in OpenMediaVault rpc.php server with a synthetic NAS of any size
+
+    python -m bench.fake_omv --disks 200 --raids 40 --latency 0.05
+"""
+# -*- coding:utf-8 -*-
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SESSION_COOKIE = "X-OPENMEDIAVAULT-SESSIONID"
+
+
+def _device(index):
+    """Device file of the index-th disk: sda .. sdz, sdaa .."""
+    letters = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(ord("a") + rest) + letters
+    return "/dev/sd" + letters
+
+
+class SyntheticNas(object):
+    """rpc.php responses of a made up NAS, raids split the disks evenly
+    and every raid and leftover disk carries one filesystem"""
+    def __init__(self, disks=8, raids=2, sensors=4, services=10, seed=0):
+        self._random = random.Random(seed)
+        raids = min(raids, disks // 2)
+        self.disks = [_device(index) for index in range(disks)]
+        per_raid = (disks // raids) if raids else 0
+        self.raids = []
+        for index in range(raids):
+            members = self.disks[index * per_raid:(index + 1) * per_raid]
+            self.raids.append({
+                "devicefile": "/dev/md%d" % index,
+                "name": "nas:%d" % index,
+                "level": "raid%d" % (1 if per_raid == 2 else 5),
+                "state": "clean",
+                "devices": [disk + "1" for disk in members],
+            })
+        loose = self.disks[raids * per_raid:]
+        self.volumes = []
+        for raid in self.raids:
+            self.volumes.append(self._volume(raid["devicefile"],
+                                             raid["devicefile"]))
+        for disk in loose:
+            self.volumes.append(self._volume(disk + "1", disk))
+        self.sensors = sensors
+        self.services = services
+
+    def _volume(self, devicefile, parent):
+        """One filesystem entry"""
+        size = self._random.randint(1, 16) * 10 ** 12
+        return {
+            "devicefile": devicefile,
+            "parentdevicefile": parent,
+            "mounted": True,
+            "size": str(size),
+            "available": str(self._random.randint(0, size)),
+            "label": devicefile.split("/")[-1],
+            "type": "ext4",
+        }
+
+    def _smart(self):
+        """Smart.enumerateDevices, temperatures drift between calls"""
+        return [{
+            "devicefile": disk,
+            "model": "WDC WD40EFRX",
+            "serialnumber": "WD-%08d" % index,
+            "overallstatus": "GOOD" if index % 50 else "BAD_SECTOR",
+            "temperature": "%d°C" % self._random.randint(28, 45),
+        } for index, disk in enumerate(self.disks)]
+
+    def _information(self):
+        """System.getInformation"""
+        return {
+            "hostname": "bench", "version": "5.6.13",
+            "cpuModelName": "Synthetic CPU", "kernel": "5.10.0",
+            "time": time.strftime("%c"), "uptime": "1 day",
+            "loadAverage": {"1min": 0.5, "5min": 0.4, "15min": 0.3},
+            "cpuUsage": self._random.random() * 100,
+            "memTotal": 16 * 1024 ** 3, "memFree": 4 * 1024 ** 3,
+            "memUsed": 12 * 1024 ** 3, "configDirty": False,
+            "rebootRequired": False, "pkgUpdatesAvailable": False,
+        }
+
+    def _health(self):
+        """Health.getHealthInfo"""
+        sensors = []
+        for index in range(self.sensors):
+            if index % 2:
+                sensors.append({"index": index, "name": "Fan %d" % index,
+                                "value": str(self._random.randint(900, 1500))})
+            else:
+                sensors.append({"index": index,
+                                "name": "CPU temperature %d" % index,
+                                "value": str(self._random.randint(40, 70))})
+        return sensors
+
+    def _services(self):
+        """services.getStatus"""
+        return [{"name": "service%d" % index, "title": "Service %d" % index,
+                 "enabled": True, "running": bool(index % 3)}
+                for index in range(self.services)]
+
+    def respond(self, service, method, params):
+        """Response of one rpc, None for calls the NAS does not know"""
+        if (service, method) == ("System", "getInformation"):
+            return self._information()
+        if (service, method) == ("FileSystemMgmt", "enumerateFilesystems"):
+            return self.volumes
+        if (service, method) == ("Smart", "enumerateDevices"):
+            return self._smart()
+        if (service, method) == ("Smart", "getAttributes"):
+            return [{"id": 194, "attrname": "Temperature_Celsius",
+                     "rawvalue": "35", "value": 100, "worst": 100,
+                     "threshold": 0}]
+        if (service, method) == ("RaidMgmt", "enumerateDevices"):
+            return self.raids
+        if (service, method) == ("DiskMgmt", "enumerateDevices"):
+            return [{"devicefile": disk} for disk in self.disks]
+        if (service, method) == ("Health", "getHealthInfo"):
+            return self._health()
+        if (service.lower(), method) == ("services", "getStatus"):
+            return self._services()
+        return None
+
+
+class FakeOmv(object):
+    """Threaded rpc.php server answering for a SyntheticNas"""
+    # pylint: disable=too-many-arguments
+    def __init__(self, nas, port=0, latency=0.0, jitter=0.0,
+                 session_timeout=300):
+        self.nas = nas
+        self.latency = latency
+        self.jitter = jitter
+        self.session_timeout = session_timeout
+        self.calls = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port),
+                                           self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+    # pylint: enable=too-many-arguments
+
+    @property
+    def url(self):
+        """Base url of the server"""
+        return "http://127.0.0.1:%d" % self._server.server_address[1]
+
+    @property
+    def port(self):
+        """Port the server listens on"""
+        return self._server.server_address[1]
+
+    def _session_valid(self, session):
+        """Whether a session id is logged in and not idle for too long"""
+        with self._lock:
+            used = self._sessions.get(session)
+            now = time.monotonic()
+            if used is None or now - used > self.session_timeout:
+                self._sessions.pop(session, None)
+                return False
+            self._sessions[session] = now
+            return True
+
+    def answer(self, packet, cookie):
+        """rpc.php response body and cookie to set for a request packet"""
+        with self._lock:
+            self.calls += 1
+        service = packet.get("service")
+        method = packet.get("method")
+        if (service, method) == ("session", "login"):
+            session = uuid.uuid4().hex
+            with self._lock:
+                self._sessions[session] = time.monotonic()
+            return {"response": {"authenticated": True, "username":
+                                 packet["params"]["username"]},
+                    "error": None}, session
+        if not self._session_valid(cookie):
+            return {"response": None, "error": {
+                "code": 5001, "message": "Session not authenticated."}}, None
+        if (service, method) == ("session", "logout"):
+            with self._lock:
+                self._sessions.pop(cookie, None)
+            return {"response": None, "error": None}, None
+        response = self.nas.respond(service, method, packet.get("params"))
+        if response is None:
+            return {"response": None, "error": {
+                "code": 9, "message": "Unknown method %s.%s" %
+                                      (service, method)}}, None
+        return {"response": response, "error": None}, None
+
+    def _handler(self):
+        """Request handler class bound to this server"""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Handles POST /rpc.php"""
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _cookie(self):
+                for part in (self.headers.get("Cookie") or "").split(";"):
+                    name, _, value = part.strip().partition("=")
+                    if name == SESSION_COOKIE:
+                        return value
+                return None
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                packet = json.loads(self.rfile.read(length) or b"{}")
+                delay = fake.latency + random.uniform(0, fake.jitter)
+                if delay:
+                    time.sleep(delay)
+                body, session = fake.answer(packet, self._cookie())
+                raw = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                if session is not None:
+                    self.send_header("Set-Cookie", "%s=%s; path=/" %
+                                     (SESSION_COOKIE, session))
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+        return Handler
+
+    def start(self):
+        """Serves on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="fake-omv", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving"""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def add_arguments(parser):
+    """Options describing the synthetic NAS"""
+    parser.add_argument("--disks", type=int, default=8)
+    parser.add_argument("--raids", type=int, default=2)
+    parser.add_argument("--sensors", type=int, default=4)
+    parser.add_argument("--services", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every rpc")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random extra seconds up to this")
+    parser.add_argument("--session-timeout", type=float, default=300)
+
+
+def from_arguments(args, port=0):
+    """FakeOmv configured from parsed options"""
+    nas = SyntheticNas(args.disks, args.raids, args.sensors, args.services)
+    return FakeOmv(nas, port, args.latency, args.jitter,
+                   args.session_timeout)
+
+
+def main():
+    """Runs the fake server in the foreground"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    fake = from_arguments(args, args.port)
+    print("Fake OpenMediaVault at %s/rpc.php" % fake.url)
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
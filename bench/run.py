@@ -0,0 +1,214 @@
+"""Drives every api route against a fake OpenMediaVault and reports
+throughput and latency percentiles
+
+    python -m bench.run --disks 200 --raids 40 --concurrency 32
+"""
+# -*- coding:utf-8 -*-
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+import httpx
+import yaml
+
+from bench import fake_omv
+
+# Every route except /stream and /ws, which stay open. The /hosts routes
+# use the first host AppServer configures.
+ROUTES = (
+    "/", "/healthz", "/readyz", "/stats", "/host", "/data_age",
+    "/volumes", "/volumes?size_used_p>50&fields=id,size_used_p",
+    "/disks", "/disks/sda/smart", "/raids", "/fans", "/temps",
+    "/detailed_storage", "/detailed_host", "/services", "/metrics",
+    "/snapshot", "/snapshot?include=host,volumes,disks",
+    "/history", "/history/cpu_usage", "/history/cpu_usage?tier=1min",
+    "/changes", "/alerts", "/hosts", "/hosts/nas0/history/cpu_usage",
+    "/hosts/nas0/changes", "/hosts/nas0/disks/sda/smart",
+    "/hosts/nas0/snapshot", "/hosts/nas0/volumes", "/hosts/nas0/metrics",
+    "/fleet/volumes", "/fleet/volumes?min_used_p=50",
+)
+
+
+def percentile(values, fraction):
+    """Value below which the given fraction of the sorted values fall"""
+    if not values:
+        return None
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+async def drive(client, path, concurrency, duration):
+    """Requests a path from concurrency workers for duration seconds"""
+    latencies = []
+    errors = [0]
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                response = await client.get(path)
+                if response.status_code != 200:
+                    errors[0] += 1
+            except httpx.HTTPError:
+                errors[0] += 1
+            latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def drive_all(url, routes, concurrency, duration):
+    """Benchmarks the routes one after another"""
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits,
+                                 timeout=30) as client:
+        results = []
+        for path in routes:
+            results.append(await drive(client, path, concurrency, duration))
+        return results
+
+
+def bench_models(nas, repeat):
+    """Per call cost of parsing the storage payload and rendering it,
+    without any http in between"""
+    # Imported here so --url runs do not need the app modules
+    import render
+    from omv.omv import OmvStorage
+
+    raw = {
+        "volumes": nas.respond("FileSystemMgmt", "enumerateFilesystems",
+                               None),
+        "smart": nas.respond("Smart", "enumerateDevices", None),
+        "raid": nas.respond("RaidMgmt", "enumerateDevices", None),
+        "disk": nas.respond("DiskMgmt", "enumerateDevices", None),
+    }
+    storage = OmvStorage(raw)
+    cases = (
+        ("OmvStorage(raw)", lambda: OmvStorage(raw)),
+        ("render.volumes", lambda: render.volumes(storage)),
+        ("render.disks", lambda: render.disks(storage)),
+        ("render.raids", lambda: render.raids(storage)),
+    )
+    results = []
+    for name, call in cases:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            call()
+        results.append((name, (time.perf_counter() - started) / repeat))
+    return results
+
+
+class AppServer(object):
+    """The api served by uvicorn on a background thread"""
+    def __init__(self, fake, hosts, port):
+        fleet = {"hosts": {
+            "nas%d" % index: {
+                "host": "127.0.0.1", "port": fake.port, "user": "admin",
+                "password": "openmediavault", "https": False,
+            } for index in range(hosts)
+        }}
+        handle, self._fleet_file = tempfile.mkstemp(suffix=".yml")
+        with os.fdopen(handle, "w") as fleet_file:
+            yaml.safe_dump(fleet, fleet_file)
+        os.environ["OPENMEDIAVAULT_FLEET"] = self._fleet_file
+
+        # Imported once the environment points to the fake hosts
+        import uvicorn
+        import main
+
+        self.url = "http://127.0.0.1:%d" % port
+        self._server = uvicorn.Server(uvicorn.Config(
+            main.app, host="127.0.0.1", port=port, log_level="warning"))
+        # Signals can only be handled on the main thread
+        self._server.install_signal_handlers = lambda: None
+        self._thread = threading.Thread(target=self._server.run,
+                                        name="bench-api", daemon=True)
+
+    def start(self, timeout=60):
+        """Starts the api and waits until every host was fetched"""
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(self.url + "/readyz").status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("api not ready after %s seconds" % timeout)
+
+    def stop(self):
+        """Stops the api"""
+        self._server.should_exit = True
+        self._thread.join()
+        os.remove(self._fleet_file)
+
+
+def report(results, models):
+    """Prints the results as a table"""
+    print("%-48s %9s %7s %10s %9s %9s" % (
+        "route", "requests", "errors", "req/s", "p50 ms", "p99 ms"))
+    for result in results:
+        print("%-48s %9d %7d %10.1f %9.2f %9.2f" % (
+            result["path"], result["requests"], result["errors"],
+            result["rps"], result["p50"] * 1000, result["p99"] * 1000))
+    if models:
+        print()
+        print("%-48s %9s" % ("model", "ms/call"))
+        for name, seconds in models:
+            print("%-48s %9.3f" % (name, seconds * 1000))
+
+
+def main():
+    """Runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    fake_omv.add_arguments(parser)
+    parser.add_argument("--hosts", type=int, default=1,
+                        help="fleet hosts, all served by the fake")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=3,
+                        help="seconds per route")
+    parser.add_argument("--route", action="append", dest="routes",
+                        help="route to drive, repeatable, default all")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--url", help="benchmark a running api instead, "
+                        "e.g. one polling python -m bench.fake_omv")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="calls per model benchmark, 0 skips them")
+    args = parser.parse_args()
+
+    fake = fake_omv.from_arguments(args)
+    models = bench_models(fake.nas, args.repeat) if args.repeat else []
+    app = None
+    url = args.url
+    if url is None:
+        fake.start()
+        app = AppServer(fake, args.hosts, args.port)
+        app.start()
+        url = app.url
+    try:
+        results = asyncio.run(drive_all(url, args.routes or ROUTES,
+                                        args.concurrency, args.duration))
+    finally:
+        if app is not None:
+            app.stop()
+            fake.stop()
+    report(results, models)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Response bodies rendered once per snapshot version"""
+# -*- coding:utf-8 -*-
+import asyncio
+import collections
+import gzip
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException, Response
+
+import render
+from omv.omv import RpcError
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CachedBody = collections.namedtuple(
+    "CachedBody", ["version", "body", "etag", "last_modified", "fetched",
+                   "media_type", "stale", "variants"])
+
+# Content codings by preference, brotli only if the module is installed
+ENCODINGS = [("gzip", lambda body: gzip.compress(body, 6, mtime=0))]
+if brotli is not None:
+    ENCODINGS.insert(0, ("br", lambda body: brotli.compress(body, quality=5)))
+
+# Smaller bodies are sent as they are, compressing would not pay off
+MIN_COMPRESS_SIZE = 1024
+
+
+def accepted_encoding(accept_encoding):
+    """Preferred coding out of ENCODINGS allowed by an Accept-Encoding
+    header, None for the identity"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    for name, _ in ENCODINGS:
+        if weights.get(name, weights.get("*", 0.0)) > 0:
+            return name
+    return None
+
+
+class ResponseCache(object):
+    """Serves each endpoint from JSON bytes rendered once per data refresh"""
+    def __init__(self, api, cold_timeout=10):
+        self._api = api
+        self._cold_timeout = cold_timeout
+        self._entries = {}
+        # Data group -> hit, miss, stale and cold counts
+        self._stats = collections.defaultdict(collections.Counter)
+
+    def _count(self, groups, outcome):
+        """Counts a cache outcome for every data group of an endpoint"""
+        for group in groups:
+            self._stats[group][outcome] += 1
+
+    @property
+    def stats(self):
+        """Cache outcomes per data group"""
+        return {group: dict(counts) for group, counts in self._stats.items()}
+
+    async def _warm(self, group):
+        """Waits a bounded time for a group that was never fetched"""
+        try:
+            # The fetch is shared and shielded, giving up does not stop it
+            await asyncio.wait_for(self._api.get(group), self._cold_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503, detail="Data not available yet",
+                headers={"Retry-After": "5"})
+        except RpcError as err:
+            # Rejected credentials or no data, the message says which
+            raise HTTPException(
+                status_code=503, detail="OpenMediaVault: %s" % err,
+                headers={"Retry-After": "5"})
+        # pylint: disable=broad-except
+        except Exception as err:
+            raise HTTPException(
+                status_code=503, detail="OpenMediaVault unreachable: %r" % err,
+                headers={"Retry-After": "5"})
+        # pylint: enable=broad-except
+
+    async def _snapshots(self, groups):
+        """Current snapshots, versions and fetch times of data groups"""
+        for group in groups:
+            if self._api.version(group) == 0:
+                self._count((group,), "cold")
+                await self._warm(group)
+        # No await from here on, the refresher runs on the same loop so
+        # snapshots and versions are read from one consistent generation
+        return [self._api.current(group) + (self._api.fetched_at(group),)
+                for group in groups]
+
+    @staticmethod
+    def _endpoint(endpoint):
+        """Data groups, builder and media type of an endpoint, a tuple of
+        endpoint names is one payload holding all of them"""
+        if isinstance(endpoint, tuple):
+            groups, build = render.batch(endpoint)
+            return groups, build, None
+        if endpoint in render.TEXT_ENDPOINTS:
+            return render.TEXT_ENDPOINTS[endpoint]
+        groups, build = render.ENDPOINTS[endpoint]
+        return groups, build, None
+
+    def _render(self, endpoint, snapshots, selection=None):
+        """Serializes an endpoint payload to bytes"""
+        _, build, media_type = self._endpoint(endpoint)
+        snapshots = [snapshot for snapshot, _, _ in snapshots]
+        if selection is not None:
+            payload = build(*snapshots, selection=selection)
+        else:
+            payload = build(*snapshots)
+        if media_type is not None:
+            return payload.encode("utf-8")
+        return json.dumps(
+            {"status_code": 200, "response": payload},
+            ensure_ascii=False, allow_nan=False, indent=None,
+            separators=(",", ":")).encode("utf-8")
+
+    def _entry(self, groups, version, body, snapshots, media_type):
+        """Wraps a rendered body with its validators"""
+        fetched = max(fetched for _, _, fetched in snapshots)
+        return CachedBody(
+            version=version,
+            body=body,
+            etag='"%s"' % hashlib.sha1(body).hexdigest(),
+            last_modified=formatdate(fetched, usegmt=True),
+            fetched=int(fetched),
+            media_type=media_type or "application/json",
+            stale=any(self._api.stale(group) for group in groups),
+            variants={})
+
+    async def entry(self, endpoint, selection=None):
+        """Cached body of an endpoint, rendered again only on new data.
+        Selections are rendered per request, the cache would grow with
+        every distinct query."""
+        groups, _, media_type = self._endpoint(endpoint)
+        snapshots = await self._snapshots(groups)
+        version = tuple(version for _, version, _ in snapshots)
+
+        if selection is not None:
+            try:
+                body = self._render(endpoint, snapshots, selection)
+            except ValueError as err:
+                # Raw rpc.php items are only checked against the data
+                raise HTTPException(status_code=400, detail=str(err))
+            entry = self._entry(groups, version, body, snapshots, media_type)
+        else:
+            entry = self._entries.get(endpoint)
+            if entry is None or entry.version != version:
+                body = self._render(endpoint, snapshots)
+                entry = self._entry(groups, version, body, snapshots,
+                                    media_type)
+                self._entries[endpoint] = entry
+                self._count(groups, "miss")
+            else:
+                self._count(groups, "hit")
+        if entry.stale:
+            self._count(groups, "stale")
+        return entry
+
+    async def body(self, endpoint):
+        """JSON body of an endpoint"""
+        return (await self.entry(endpoint)).body
+
+    @staticmethod
+    def _variant(entry, encoding):
+        """Body of an entry in a content coding, compressed once per entry
+        and reused until the next refresh replaces the entry"""
+        body = entry.variants.get(encoding)
+        if body is None:
+            body = dict(ENCODINGS)[encoding](entry.body)
+            entry.variants[encoding] = body
+        return body
+
+    @staticmethod
+    def _not_modified(request, entry, etag):
+        """Whether the client already holds this entry"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            # If-None-Match uses the weak comparison
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return etag in [
+                tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return entry.fetched <= since
+        return False
+
+    async def response(self, endpoint, request=None, selection=None):
+        """Raw response of an endpoint, 304 if the client copy is current"""
+        entry = await self.entry(endpoint, selection)
+        body = entry.body
+        etag = entry.etag
+        encoding = None
+        if request is not None and len(body) >= MIN_COMPRESS_SIZE:
+            encoding = accepted_encoding(
+                request.headers.get("accept-encoding"))
+        if encoding is not None:
+            body = self._variant(entry, encoding)
+            # Every coding is a different representation with its own tag
+            etag = '%s-%s"' % (entry.etag[:-1], encoding)
+
+        headers = {"ETag": etag, "Last-Modified": entry.last_modified,
+                   "Vary": "Accept-Encoding"}
+        if entry.stale:
+            # Restored from the snapshot file, not polled since the start
+            headers["Warning"] = '110 - "Response is Stale"'
+        if request is not None and self._not_modified(request, entry, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, headers=headers,
+                        media_type=entry.media_type)
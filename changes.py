@@ -0,0 +1,169 @@
+"""Generations of the storage, health and services data with the
+JSON Patch operations leading from one to the next"""
+# -*- coding:utf-8 -*-
+import collections
+import uuid
+
+import render
+
+# Data group -> endpoints making up its part of the document
+SECTIONS = {
+    "storage": ("volumes", "disks", "raids"),
+    "health": ("fans", "temps"),
+    "services": ("services",),
+}
+# Field identifying the entries of an endpoint, "id" if not listed
+ENTRY_KEYS = {
+    "services": "name",
+}
+
+
+def _pointer(token):
+    """Escapes a JSON Pointer reference token"""
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _diff(path, old, new, operations):
+    """Appends the operations turning old into new, objects are compared
+    key by key and anything else is replaced as a whole"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                operations.append(
+                    {"op": "remove", "path": path + "/" + _pointer(key)})
+        for key, value in new.items():
+            if key not in old:
+                operations.append({"op": "add", "value": value,
+                                   "path": path + "/" + _pointer(key)})
+            else:
+                _diff(path + "/" + _pointer(key), old[key], value,
+                      operations)
+    elif old != new:
+        operations.append({"op": "replace", "path": path, "value": new})
+
+
+def _keyed(endpoint, payload):
+    """Entries of an endpoint payload keyed by their identifying field"""
+    if isinstance(payload, dict):
+        # Some OMV versions wrap the service list
+        payload = payload.get("data", [])
+    key = ENTRY_KEYS.get(endpoint, "id")
+    return {str(entry.get(key)): entry for entry in payload}
+
+
+class ChangeFeed(object):
+    """Numbers every refresh of the storage, health and services data and
+    keeps the patches of the last depth generations.
+
+    A replica, in a worker of a multi-process deployment, serves the
+    generations numbered by the poller process instead of its own so every
+    worker answers a client the same way. It still diffs the refreshes it
+    replicates to call its listeners.
+    """
+    def __init__(self, api, depth=64, replica=False):
+        # Generations only mean something within one poller, clients
+        # sending another epoch get a full snapshot
+        self.epoch = uuid.uuid4().hex[:12]
+        self.generation = 0
+        self._replica = replica
+        # Sections of the last refresh, the served document unless replica
+        self._sections = {}
+        self._document = {} if replica else self._sections
+        self._patches = collections.deque(maxlen=depth)
+        self._listeners = []
+        self._publishers = []
+        # Groups whose data listeners have not seen since it was restored
+        self._unseen = set()
+        self._api = api
+        api.add_listener(self._on_refresh)
+
+    def add_listener(self, callback):
+        """Calls callback(endpoint, changed, snapshot) for every endpoint
+        with changed entries, changed maps their keys to the new entry or
+        None and snapshot is the refreshed data they were rendered from.
+
+        Data restored from a previous run is not reported, it may be hours
+        old. The first fetch after it reports every entry as changed.
+        """
+        self._listeners.append(callback)
+
+    def add_publisher(self, callback):
+        """Calls callback() after every new generation"""
+        self._publishers.append(callback)
+
+    def _on_refresh(self, group, snapshot):
+        """Diffs the sections of a refreshed group into a new generation"""
+        if group not in SECTIONS:
+            return
+        stale = self._api.stale(group)
+        unseen = group in self._unseen
+        operations = []
+        for endpoint in SECTIONS[group]:
+            _, build = render.ENDPOINTS[endpoint]
+            section = _keyed(endpoint, build(snapshot))
+            old = self._sections.get(endpoint)
+            if old is None:
+                operations.append(
+                    {"op": "add", "path": "/" + endpoint, "value": section})
+                old = {}
+            else:
+                _diff("/" + endpoint, old, section, operations)
+            self._sections[endpoint] = section
+            if stale:
+                continue
+            if unseen:
+                changed = dict(section)
+            else:
+                changed = {key: entry for key, entry in section.items()
+                           if old.get(key) != entry}
+                changed.update(
+                    {key: None for key in old if key not in section})
+            if changed:
+                for callback in self._listeners:
+                    callback(endpoint, changed, snapshot)
+        if stale:
+            self._unseen.add(group)
+        else:
+            self._unseen.discard(group)
+        if operations and not self._replica:
+            self.generation += 1
+            self._patches.append((self.generation, operations))
+            for callback in self._publishers:
+                callback()
+
+    def since(self, generation, epoch=None):
+        """Operations after a generation, the full document if they are no
+        longer all kept or the generation is from another epoch"""
+        changes = {"epoch": self.epoch, "generation": self.generation}
+        oldest = self._patches[0][0] if self._patches else \
+            self.generation + 1
+        if (epoch is not None and epoch != self.epoch) or \
+           generation is None or generation > self.generation or \
+           generation < oldest - 1:
+            changes["full"] = True
+            changes["snapshot"] = self._document
+            return changes
+        changes["full"] = False
+        changes["changes"] = [
+            operation for number, operations in self._patches
+            if number > generation for operation in operations]
+        return changes
+
+    def raw(self):
+        """Epoch, generation, kept patches and document, as published to
+        worker processes"""
+        return {
+            "epoch": self.epoch,
+            "generation": self.generation,
+            "patches": list(self._patches),
+            "document": self._document,
+        }
+
+    def replicate(self, feed):
+        """Swaps in the generations numbered by the poller process"""
+        self.epoch = feed["epoch"]
+        self.generation = feed["generation"]
+        self._patches.clear()
+        self._patches.extend((number, operations)
+                             for number, operations in feed["patches"])
+        self._document = feed["document"]
@@ -0,0 +1,219 @@
+"""Registry of the OpenMediaVault hosts served by this api"""
+# -*- coding:utf-8 -*-
+import asyncio
+import time
+
+import render
+from alerts import AlertEngine, load_rules
+from cache import ResponseCache
+from changes import ChangeFeed
+from history import History
+from omv.aio import AsyncOpenmediavault
+from omv.ratelimit import RpcThrottle
+from omv.refresher import AsyncOmvRefresher
+from omv.replica import ReplicaOpenmediavault
+from shared import SharedSnapshots
+from smart import SmartCollector
+from snapshots import SnapshotStore
+from stream import LiveFeed
+
+
+class FleetMember(object):
+    """One OpenMediaVault host with its refresher, cache, live feed, metric
+    history, change feed and S.M.A.R.T. collector"""
+    # pylint: disable=too-many-arguments
+    def __init__(self, name, api, ttls, cold_timeout=10, history_samples=720,
+                 change_depth=64, smart=None, replica=False):
+        self.name = name
+        self.api = api
+        self.refresher = AsyncOmvRefresher(api, ttls)
+        self.responses = ResponseCache(api, cold_timeout)
+        self.live = LiveFeed(api)
+        self.history = History(api, history_samples)
+        self.changes = ChangeFeed(api, change_depth, replica)
+        self.smart = SmartCollector(api, **(smart or {}))
+    # pylint: enable=too-many-arguments
+
+
+class Fleet(object):
+    """Named OpenMediaVault clients polled by one bounded poller"""
+    # pylint: disable=too-many-arguments
+    def __init__(self, hosts, ttls, session_timeout=300, max_concurrency=4,
+                 cold_timeout=10, history_samples=720, snapshot_file=None,
+                 throttle=None, shared_dir=None, change_depth=64, alerts=None,
+                 smart=None):
+        self._members = {}
+        self._max_concurrency = max_concurrency
+        self._store = None
+        if snapshot_file:
+            self._store = SnapshotStore(snapshot_file)
+        # Workers of a multi-process deployment follow the poller process
+        # instead of polling themselves
+        self._shared = None
+        self._follower = None
+        # Without sinks alerts are only listed at /alerts
+        self.alerts = alerts or AlertEngine(load_rules())
+        self._alerter = None
+        self._collectors = []
+        if shared_dir:
+            self._shared = SharedSnapshots(shared_dir)
+        for name, host in hosts.items():
+            if self._shared is not None:
+                api = ReplicaOpenmediavault()
+            else:
+                api = AsyncOpenmediavault(
+                    host["host"], host.get("port", 443), host["user"],
+                    host["password"], host.get("https", True),
+                    session_timeout=host.get("session_timeout",
+                                             session_timeout),
+                    throttle=RpcThrottle(**(throttle or {})))
+            self._members[name] = FleetMember(name, api, ttls, cold_timeout,
+                                              history_samples, change_depth,
+                                              smart, self._shared is not None)
+            self.alerts.watch(name, self._members[name].changes)
+            if self._store is not None:
+                # Serve the last good data of the previous run until the
+                # first poll of each group
+                self._store.attach(name, api)
+    # pylint: enable=too-many-arguments
+
+    @property
+    def names(self):
+        """Names of all hosts"""
+        return list(self._members)
+
+    @property
+    def default(self):
+        """The first configured host, served by the unscoped routes"""
+        return next(iter(self._members.values()), None)
+
+    def readiness(self):
+        """Per host and data group, whether a snapshot was fetched or
+        restored yet"""
+        return {
+            name: {group: member.api.version(group) > 0
+                   for group in member.api.GROUPS}
+            for name, member in self._members.items()
+        }
+
+    @property
+    def ready(self):
+        """Whether every group of every host has been fetched, and in a
+        worker whether it still follows the poller"""
+        if self._follower is not None and self._follower.done():
+            return False
+        readiness = self.readiness()
+        return bool(readiness) and all(
+            all(groups.values()) for groups in readiness.values())
+
+    def get(self, name):
+        """Returns a host by name, None if unknown"""
+        return self._members.get(name)
+
+    def start(self):
+        """Starts polling every host, at most max_concurrency at a time"""
+        if self.alerts.sinks:
+            self._alerter = asyncio.ensure_future(self.alerts.run())
+        if self._shared is not None:
+            self._follower = asyncio.ensure_future(
+                self._shared.follow(self._replicate))
+            return
+        # Created here so it belongs to the running loop
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        for member in self._members.values():
+            member.refresher.start(semaphore)
+            if member.smart.interval:
+                self._collectors.append(
+                    asyncio.ensure_future(member.smart.run()))
+
+    def _replicate(self, host, group, fetched, raw, stale):
+        """Hands data published by the poller to the host it belongs to"""
+        member = self._members.get(host)
+        if member is None:
+            return
+        if group == "smart":
+            member.smart.replicate(raw)
+        elif group == "changes":
+            member.changes.replicate(raw)
+        else:
+            member.api.replicate(group, raw, fetched, stale)
+
+    def publish(self, shared_dir):
+        """Publishes every snapshot for workers following shared_dir"""
+        shared = SharedSnapshots(shared_dir)
+        shared.create(list(self._members),
+                      AsyncOpenmediavault.GROUPS + ("smart", "changes"))
+        for name, member in self._members.items():
+            shared.attach(name, member.api)
+            member.smart.add_listener(self._smart_publisher(shared, name))
+            member.changes.add_publisher(
+                self._changes_publisher(shared, name))
+            # Data restored from the snapshot file is published right away
+            for group in member.api.GROUPS:
+                if member.api.version(group) > 0:
+                    shared.publish(name, group, member.api.fetched_at(group),
+                                   member.api.raw(group),
+                                   member.api.stale(group))
+            if member.changes.generation > 0:
+                shared.publish(name, "changes", time.time(),
+                               member.changes.raw())
+        return shared
+
+    def _smart_publisher(self, shared, name):
+        """Listener publishing the S.M.A.R.T. attributes of a host"""
+        smart = self._members[name].smart
+        return lambda: shared.publish(name, "smart", time.time(), smart.raw())
+
+    def _changes_publisher(self, shared, name):
+        """Publisher of the change feed of a host, workers serve its
+        generations"""
+        changes = self._members[name].changes
+        return lambda: shared.publish(name, "changes", time.time(),
+                                      changes.raw())
+
+    async def stop(self):
+        """Stops polling and closes all clients"""
+        for task in [self._follower, self._alerter] + self._collectors:
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._follower = self._alerter = None
+        self._collectors = []
+        if self._shared is not None:
+            self._shared.close()
+        for member in self._members.values():
+            await member.refresher.stop()
+            await member.api.aclose()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def stats(self):
+        """rpc.php and cache counters of every host"""
+        return {
+            name: {
+                "rpc": member.api.stats.summary(),
+                "cache": member.responses.stats,
+            }
+            for name, member in self._members.items()
+        }
+
+    def volumes_over(self, used_p):
+        """Volumes of all hosts filled to at least used_p percent, answered
+        from the snapshots in memory"""
+        found = []
+        for name, member in self._members.items():
+            storage, _ = member.api.current("storage")
+            if storage is None:
+                continue
+            for volume in storage.volumes:
+                percentage = storage.volume_percentage_used(volume)
+                if percentage is not None and percentage >= used_p:
+                    entry = render.volume(storage, volume)
+                    entry["host"] = name
+                    found.append(entry)
+        return found
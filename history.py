@@ -0,0 +1,137 @@
+"""Bounded in-memory history of the host and health metrics"""
+# -*- coding:utf-8 -*-
+from array import array
+
+# Tier name -> (seconds per point, None keeps every sample, points kept)
+TIERS = (
+    ("raw", None, None),
+    ("1min", 60, 1440),
+    ("1hour", 3600, 24 * 31),
+)
+
+
+class _Ring(object):
+    """Fixed-size ring of (timestamp, value) pairs, allocated up front"""
+    def __init__(self, capacity):
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._capacity = capacity
+        self._next = 0
+        self._size = 0
+
+    def append(self, timestamp, value):
+        """Stores a point, overwriting the oldest when full"""
+        self._times[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def window(self, since=None):
+        """Timestamps and values in order, optionally only from since on"""
+        start = (self._next - self._size) % self._capacity
+        order = [(start + offset) % self._capacity
+                 for offset in range(self._size)]
+        if since is not None:
+            order = [slot for slot in order if self._times[slot] >= since]
+        return ([self._times[slot] for slot in order],
+                [self._values[slot] for slot in order])
+
+
+class _Tier(object):
+    """Ring of samples averaged over fixed buckets of step seconds"""
+    def __init__(self, step, capacity):
+        self.step = step
+        self._ring = _Ring(capacity)
+        self._bucket = None
+        self._sum = 0.0
+        self._count = 0
+
+    def add(self, timestamp, value):
+        """Adds a sample, closing the current bucket when it is over"""
+        if self.step is None:
+            self._ring.append(timestamp, value)
+            return
+        bucket = timestamp - timestamp % self.step
+        if bucket != self._bucket:
+            if self._count:
+                self._ring.append(self._bucket, self._sum / self._count)
+            self._bucket = bucket
+            self._sum = 0.0
+            self._count = 0
+        self._sum += value
+        self._count += 1
+
+    def window(self, since=None):
+        """Closed buckets followed by the running average of the open one"""
+        times, values = self._ring.window(since)
+        if self._count and (since is None or self._bucket >= since):
+            times.append(self._bucket)
+            values.append(self._sum / self._count)
+        return times, values
+
+
+class History(object):
+    """Keeps every tier of every host and health metric of one host, fed by
+    its refreshes. Memory is bounded by the tier sizes and metric count."""
+    def __init__(self, api, raw_samples=720):
+        self._raw_samples = raw_samples
+        self._metrics = {}
+        self._api = api
+        api.add_listener(self._on_refresh)
+
+    def _samples(self, group, snapshot):
+        """Metric name -> value of a snapshot"""
+        if group == "utilisation":
+            host = snapshot.host
+            if host is None:
+                return {}
+            return {
+                "cpu_usage": host.cpu_usage,
+                "load_1min": host.load_1min,
+                "load_5min": host.load_5min,
+                "load_15min": host.load_15min,
+                "mem_used": host.mem_used,
+                "mem_free": host.mem_free,
+            }
+        if group == "health":
+            samples = {}
+            for temp in snapshot.temp or []:
+                samples["temp_%s" % temp] = snapshot.temp_value(temp)
+            for fan in snapshot.fan or []:
+                samples["fan_%s" % fan] = snapshot.fan_value(fan)
+            return samples
+        return {}
+
+    def _on_refresh(self, group, snapshot):
+        """Records the metrics of a new snapshot"""
+        timestamp = self._api.fetched_at(group)
+        for metric, value in self._samples(group, snapshot).items():
+            if isinstance(value, bool) or \
+               not isinstance(value, (int, float)):
+                continue
+            if metric not in self._metrics:
+                self._metrics[metric] = {
+                    name: _Tier(step, capacity or self._raw_samples)
+                    for name, step, capacity in TIERS}
+            for tier in self._metrics[metric].values():
+                tier.add(timestamp, float(value))
+
+    @property
+    def metrics(self):
+        """Names of the recorded metrics"""
+        return sorted(self._metrics)
+
+    def window(self, metric, tier="raw", since=None):
+        """Points of a metric in one tier as parallel arrays, KeyError if
+        the metric or tier is unknown"""
+        tiers = self._metrics[metric]
+        if tier not in tiers:
+            raise KeyError(tier)
+        times, values = tiers[tier].window(since)
+        return {
+            "metric": metric,
+            "tier": tier,
+            "step": tiers[tier].step,
+            "timestamps": times,
+            "values": values,
+        }
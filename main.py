@@ -1,6 +1,17 @@
-from settings import omvuser, omvpasswd, omvhost, omvport
-from omv.omv import Openmediavault
-from fastapi import FastAPI
+from settings import omvhosts, omvsessiontimeout, omvfleetconcurrency, \
+    omvcoldtimeout, refresh_ttls, omvhistorysamples, omvsnapshotfile, \
+    omvthrottle, omvshareddir, omvchangedepth, omvalertrules, \
+    omvalertwebhook, omvalertfile, omvsmart
+from alerts import AlertEngine, configured_sinks, load_rules
+from fleet import Fleet
+from routestats import RouteStats, RouteTimer
+from selection import Selection
+import render
+import smart
+from fastapi import FastAPI, HTTPException, Request, WebSocket, \
+    WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Optional
 import requests, json
 
 tags_metadata = [
@@ -16,14 +27,117 @@ tags_metadata = [
         "name": "health",
         "description": "OpenMediaVault health data, fans and temperature.",
     },
+    {
+        "name": "live",
+        "description": "Streams of changed host and health values.",
+    },
+    {
+        "name": "history",
+        "description": "Recent host and health values, raw and downsampled.",
+    },
+    {
+        "name": "changes",
+        "description": "Storage, health and services changes since a "
+                       "generation.",
+    },
+    {
+        "name": "alerts",
+        "description": "Threshold alerts evaluated on every refresh.",
+    },
+    {
+        "name": "fleet",
+        "description": "Data of every configured OpenMediaVault host.",
+    },
 
 ]
 
-api = Openmediavault(omvhost, omvport, omvuser, omvpasswd, True)
+if omvshareddir:
+    # A worker, the poller process owns the clients and the snapshot file
+    # and delivers the alerts
+    fleet = Fleet(omvhosts, refresh_ttls, omvsessiontimeout,
+                  omvfleetconcurrency, omvcoldtimeout, omvhistorysamples,
+                  shared_dir=omvshareddir, change_depth=omvchangedepth,
+                  alerts=AlertEngine(load_rules(omvalertrules)))
+else:
+    fleet = Fleet(omvhosts, refresh_ttls, omvsessiontimeout,
+                  omvfleetconcurrency, omvcoldtimeout, omvhistorysamples,
+                  omvsnapshotfile, omvthrottle, change_depth=omvchangedepth,
+                  alerts=AlertEngine(load_rules(omvalertrules),
+                                     configured_sinks(omvalertwebhook,
+                                                      omvalertfile)),
+                  smart=omvsmart)
 app = FastAPI(openapi_tags=tags_metadata)
+route_stats = RouteStats(app)
+app.add_middleware(RouteTimer, stats=route_stats)
+
+def history_window(member, metric, tier, since):
+    """History of a metric, 404 if the metric or tier is unknown"""
+    try:
+        window = member.history.window(metric, tier, since)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown metric or tier")
+    return {"status_code": 200, "response": window}
+
+def snapshot_endpoints(include):
+    """Endpoints named in a comma separated include list, 400 if unknown"""
+    if include is None:
+        return tuple(sorted(render.ENDPOINTS))
+    endpoints = sorted(set(name.strip() for name in include.split(",")
+                           if name.strip()))
+    if not endpoints:
+        raise HTTPException(status_code=400, detail="No endpoints included")
+    unknown = [name for name in endpoints if name not in render.ENDPOINTS]
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail="Unknown endpoints: %s" % ",".join(unknown))
+    # Sorted so every spelling of a list shares one cached body
+    return tuple(endpoints)
+
+def selection(endpoint, request):
+    """Fields and filters given in the query string, 400 if malformed"""
+    try:
+        selected = Selection.from_query(request.url.query)
+        if selected is not None:
+            render.check_selection(endpoint, selected)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return selected
+
+def smart_attributes(member, disk):
+    """S.M.A.R.T. attributes of a disk given as sda or dev/sda, 404 if the
+    disk is unknown and 503 until they were collected"""
+    disk = smart.devicefile(disk)
+    storage, _ = member.api.current("storage")
+    if storage is None or disk not in (storage.disks or ()):
+        raise HTTPException(status_code=404, detail="Unknown disk")
+    attributes = member.smart.attributes(disk)
+    if attributes is None:
+        raise HTTPException(status_code=503,
+                            detail="S.M.A.R.T. attributes not collected yet")
+    return_data = {
+        "status_code": 200,
+        "response": dict(attributes, id=disk)
+    }
+    return (return_data)
+
+def default_host():
+    """The first configured host, served by the unscoped routes"""
+    if fleet.default is None:
+        raise HTTPException(status_code=503,
+                            detail="No OpenMediaVault host configured")
+    return fleet.default
+
+@app.on_event("startup")
+async def start_refresher():
+    # Only schedules the polls, the caches warm up in the background
+    fleet.start()
+
+@app.on_event("shutdown")
+async def stop_refresher():
+    await fleet.stop()
 
 @app.get("/")
-def main():
+async def main():
     url_list = [
         {
             "path": route.path,
@@ -34,138 +148,207 @@ def main():
     return url_list
 
 
-@app.get("/host", tags=["host"])
-def host():
+@app.get("/healthz", tags=["host"])
+async def healthz():
+    return {"status_code": 200, "response": "alive"}
+
+@app.get("/readyz", tags=["host"])
+async def readyz():
+    return_data = {
+        "status_code": 200 if fleet.ready else 503,
+        "response": fleet.readiness()
+    }
+    return JSONResponse(return_data, status_code=return_data["status_code"])
+
+@app.get("/stats", tags=["host"])
+async def stats():
     return_data = {
         "status_code": 200,
         "response": {
-            "hostname": str(api.utilisation.hostname),
-            "version": str(api.utilisation.version),
-            "processor": str(api.utilisation.processor),
-            "kernel": str(api.utilisation.kernel),
-            "uptime": str(api.utilisation.up_time),
-            "cpu_load": str(api.utilisation.cpu_total_load) + "%",
-            "cpu_load_1min": str(api.utilisation.cpu_1min_load) + "%",
-            "cpu_load_5min": str(api.utilisation.cpu_5min_load) + "%",
-            "cpu_load_15min": str(api.utilisation.cpu_15min_load) + "%",
-            "memory_total": str(api.utilisation.memTotal) + " KB",
-            "memory_free": str(api.utilisation.memFree) + " KB",
-            "memory_used": str(api.utilisation.memUsed) + " KB",
-            "config_dirty": str(api.utilisation.configDirty),
-            "rebootRequired": str(api.utilisation.rebootRequired),
-            "pkgUpdatesAvailable": str(api.utilisation.pkgUpdatesAvailable)
+            "hosts": fleet.stats(),
+            "routes": route_stats.summary()
         }
     }
     return (return_data)
 
-@app.get("/volumes", tags=["storage"])
-def volumes():
-    volumes = api.storage.volumes
-    volume_data = []
-    for volume in volumes:
-        vol = {}
-        vol['id'] = str(volume)
-        vol['status'] = str(api.storage.volume_status(volume))
-        vol['device_type'] = str(api.storage.volume_device_type(volume))
-        vol['mounted'] = str(api.storage._volume_mounted(volume))
-        vol['size_total'] = str(api.storage.volume_size_total(volume))
-        vol['size_used'] = str(api.storage.volume_size_used(volume))
-        vol['size_used_p'] = str(api.storage.volume_percentage_used(volume)) + "%"
-        vol['temp_avg'] = str(api.storage.volume_disk_temp_avg(volume))
-        vol['temp_max'] = str(api.storage.volume_disk_temp_max(volume))
-        volume_data.append(vol)
+@app.get("/host", tags=["host"])
+async def host(request: Request):
+    return await default_host().responses.response("host", request)
+
+@app.get("/data_age", tags=["host"])
+async def data_age():
+    api = default_host().api
     return_data = {
         "status_code": 200,
-        "response": volume_data
+        "response": {
+            group: api.data_age(group)
+            for group in api.GROUPS
+        }
     }
     return (return_data)
 
+@app.get("/volumes", tags=["storage"])
+async def volumes(request: Request):
+    return await default_host().responses.response(
+        "volumes", request, selection("volumes", request))
+
 @app.get("/disks", tags=["storage"])
-def disks():
-    disks = api.storage.disks
-    disk_data = []
-    for disk in disks:
-        dis = {}
-        dis['id'] = str(disk)
-        dis['name'] = str(api.storage.disk_name(disk))
-        dis['smart_status'] = str(api.storage.disk_smart_status(disk))
-        dis['temp'] = str(api.storage.disk_temp(disk))
-        disk_data.append(dis)
-    return_data = {
-        "status_code": 200,
-        "response": disk_data
-    }
-    return (return_data)
+async def disks(request: Request):
+    return await default_host().responses.response(
+        "disks", request, selection("disks", request))
+
+@app.get("/disks/{disk:path}/smart", tags=["storage"])
+async def disk_smart(disk: str):
+    return smart_attributes(default_host(), disk)
 
 @app.get("/raids", tags=["storage"])
-def raids():
-    raids = api.storage.raids
-    raid_data = []
-    for raid in raids:
-        rai = {}
-        rai['id'] = str(raid)
-        rai['raid_name'] = str(api.storage.raid_name(raid))
-        rai['raid_devices'] = str(api.storage.raid_devices(raid))
-        raid_data.append(rai)
+async def raids(request: Request):
+    return await default_host().responses.response(
+        "raids", request, selection("raids", request))
+
+@app.get("/fans", tags=["health"])
+async def fans(request: Request):
+    return await default_host().responses.response("fans", request)
+
+@app.get("/temps", tags=["health"])
+async def temps(request: Request):
+    return await default_host().responses.response("temps", request)
+
+@app.get("/detailed_storage", tags=["storage"])
+async def volumes(request: Request):
+    return await default_host().responses.response(
+        "detailed_storage", request, selection("detailed_storage", request))
+
+@app.get("/detailed_host", tags=["storage"])
+async def volumes(request: Request):
+    return await default_host().responses.response("detailed_host", request)
+
+@app.get("/services", tags=["host"])
+async def services(request: Request):
+    return await default_host().responses.response(
+        "services", request, selection("services", request))
+
+@app.get("/metrics", tags=["host"])
+async def metrics(request: Request):
+    return await default_host().responses.response("metrics", request)
+
+@app.get("/snapshot", tags=["host"])
+async def snapshot(request: Request, include: Optional[str] = None):
+    return await default_host().responses.response(
+        snapshot_endpoints(include), request)
+
+@app.get("/history", tags=["history"])
+async def history():
     return_data = {
         "status_code": 200,
-        "response": raid_data
+        "response": default_host().history.metrics
     }
     return (return_data)
 
-@app.get("/fans", tags=["health"])
-def fans():
-    fans = api.health.fan
-    fan_data = []
-    for fan in fans:
-        fa = {}
-        fa['id'] = str(fan)
-        fa['fan_speed'] = str(api.health.fan_value(fan))
-        fan_data.append(fa)
+@app.get("/history/{metric}", tags=["history"])
+async def history_metric(metric: str, tier: str = "raw",
+                         since: Optional[float] = None):
+    return history_window(default_host(), metric, tier, since)
+
+@app.get("/changes", tags=["changes"])
+async def changes(since: Optional[int] = None, epoch: Optional[str] = None):
     return_data = {
         "status_code": 200,
-        "response": fan_data
+        "response": default_host().changes.since(since, epoch)
     }
     return (return_data)
 
-@app.get("/temps", tags=["health"])
-def temps():
-    temps = api.health.temp
-    temp_data = []
-    for temp in temps:
-        tem = {}
-        tem['id'] = str(temp)
-        tem['temperature'] = str(api.health.temp_value(temp))
-        temp_data.append(tem)
+@app.get("/alerts", tags=["alerts"])
+async def alerts():
     return_data = {
         "status_code": 200,
-        "response": temp_data
+        "response": fleet.alerts.summary()
     }
     return (return_data)
 
-@app.get("/detailed_storage", tags=["storage"])
-def volumes():
-    detailed_storage = api.storage.detailed_storage
+@app.get("/hosts", tags=["fleet"])
+async def hosts():
     return_data = {
         "status_code": 200,
-        "response": detailed_storage
+        "response": fleet.names
     }
-    return(return_data)
+    return (return_data)
 
-@app.get("/detailed_host", tags=["storage"])
-def volumes():
-    detailed_host = api.utilisation.detailed_host
+@app.get("/hosts/{name}/history/{metric}", tags=["fleet"])
+async def host_history(name: str, metric: str, tier: str = "raw",
+                       since: Optional[float] = None):
+    member = fleet.get(name)
+    if member is None:
+        raise HTTPException(status_code=404, detail="Unknown host")
+    return history_window(member, metric, tier, since)
+
+@app.get("/hosts/{name}/changes", tags=["fleet"])
+async def host_changes(name: str, since: Optional[int] = None,
+                       epoch: Optional[str] = None):
+    member = fleet.get(name)
+    if member is None:
+        raise HTTPException(status_code=404, detail="Unknown host")
     return_data = {
         "status_code": 200,
-        "response": detailed_host
+        "response": member.changes.since(since, epoch)
     }
-    return(return_data)
+    return (return_data)
 
-@app.get("/services", tags=["host"])
-def services():
-    services_data = api.services.service
+@app.get("/hosts/{name}/disks/{disk:path}/smart", tags=["fleet"])
+async def host_disk_smart(name: str, disk: str):
+    member = fleet.get(name)
+    if member is None:
+        raise HTTPException(status_code=404, detail="Unknown host")
+    return smart_attributes(member, disk)
+
+@app.get("/hosts/{name}/snapshot", tags=["fleet"])
+async def host_snapshot(name: str, request: Request,
+                        include: Optional[str] = None):
+    member = fleet.get(name)
+    if member is None:
+        raise HTTPException(status_code=404, detail="Unknown host")
+    return await member.responses.response(
+        snapshot_endpoints(include), request)
+
+@app.get("/hosts/{name}/{endpoint}", tags=["fleet"])
+async def host_endpoint(name: str, endpoint: str, request: Request):
+    member = fleet.get(name)
+    if member is None:
+        raise HTTPException(status_code=404, detail="Unknown host")
+    if endpoint not in render.ENDPOINTS and \
+       endpoint not in render.TEXT_ENDPOINTS:
+        raise HTTPException(status_code=404, detail="Unknown endpoint")
+    selected = None
+    if endpoint in render.SELECTABLE:
+        selected = selection(endpoint, request)
+    return await member.responses.response(endpoint, request, selected)
+
+@app.get("/fleet/volumes", tags=["fleet"])
+async def fleet_volumes(min_used_p: float = 0):
     return_data = {
         "status_code": 200,
-        "response": services_data
+        "response": fleet.volumes_over(min_used_p)
     }
-    return(return_data)
+    return (return_data)
+
+@app.get("/stream", tags=["live"])
+async def stream(request: Request):
+    return StreamingResponse(default_host().live.events(request),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws")
+async def websocket(websocket: WebSocket):
+    if fleet.default is None:
+        await websocket.close(code=1013)
+        return
+    live = fleet.default.live
+    await websocket.accept()
+    queue = live.subscribe()
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live.unsubscribe(queue)
@@ -0,0 +1,131 @@
+"""Prometheus text exposition of the snapshots"""
+# -*- coding:utf-8 -*-
+
+# Starlette appends the utf-8 charset to text media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value):
+    """Escapes a label value"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def _number(value):
+    """Converts a raw OMV value to a float, None if it is not numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Exposition(object):
+    """Collects samples grouped per metric family"""
+    def __init__(self):
+        self._families = []
+        self._samples = {}
+
+    def gauge(self, metric, help_text, value, **labels):
+        """Adds a gauge sample, skipped when the value is not numeric"""
+        value = _number(value)
+        if value is None:
+            return
+        if metric not in self._samples:
+            self._families.append((metric, help_text))
+            self._samples[metric] = []
+        label_text = ",".join(
+            '%s="%s"' % (key, _escape(val)) for key, val in labels.items())
+        if label_text:
+            label_text = "{" + label_text + "}"
+        self._samples[metric].append(
+            "%s%s %r" % (metric, label_text, value))
+
+    def render(self):
+        """Text exposition format"""
+        lines = []
+        for name, help_text in self._families:
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s gauge" % name)
+            lines.extend(self._samples[name])
+        return "\n".join(lines) + "\n"
+
+
+def _host(out, utilisation):
+    """Host samples from OmvUtilization"""
+    out.gauge("omv_info", "OpenMediaVault host information", 1,
+              hostname=utilisation.hostname, version=utilisation.version,
+              kernel=utilisation.kernel)
+    out.gauge("omv_cpu_usage_percent", "Total CPU usage",
+              utilisation.cpu_total_load)
+    for period, load in (("1min", utilisation.cpu_1min_load),
+                         ("5min", utilisation.cpu_5min_load),
+                         ("15min", utilisation.cpu_15min_load)):
+        out.gauge("omv_load_average", "System load average",
+                  load, period=period)
+    # System.getInformation reports memory in bytes
+    out.gauge("omv_memory_total_bytes", "Total memory",
+              utilisation.memTotal)
+    out.gauge("omv_memory_free_bytes", "Free memory",
+              utilisation.memFree)
+    out.gauge("omv_memory_used_bytes", "Used memory",
+              utilisation.memUsed)
+    out.gauge("omv_config_dirty", "Configuration changes not applied",
+              utilisation.configDirty)
+    out.gauge("omv_reboot_required", "A reboot is required",
+              utilisation.rebootRequired)
+    out.gauge("omv_package_updates_available", "Package updates available",
+              utilisation.pkgUpdatesAvailable)
+
+
+def _storage(out, storage):
+    """Volume, raid and disk samples from OmvStorage"""
+    for volume in storage.volumes:
+        out.gauge("omv_volume_mounted", "Volume is mounted",
+                  storage.volume_mounted(volume), volume=volume)
+        out.gauge("omv_volume_size_bytes", "Volume size",
+                  storage.volume_size_total(volume, human_readable=False),
+                  volume=volume)
+        out.gauge("omv_volume_used_bytes", "Volume used space",
+                  storage.volume_size_used(volume, human_readable=False),
+                  volume=volume)
+
+    for raid in storage.raids:
+        out.gauge("omv_raid_info", "Raid level and state", 1, raid=raid,
+                  name=storage.raid_name(raid),
+                  level=storage.raid_level(raid),
+                  state=storage.raid_state(raid))
+        out.gauge("omv_raid_devices", "Number of devices in the raid",
+                  len(storage.raid_devices(raid)), raid=raid)
+
+    for disk in storage.disks:
+        out.gauge("omv_disk_temperature_celsius", "S.M.A.R.T. temperature",
+                  storage.disk_temp(disk), disk=disk,
+                  model=storage.disk_name(disk))
+        out.gauge("omv_disk_smart_status", "S.M.A.R.T. overall status", 1,
+                  disk=disk, status=storage.disk_smart_status(disk))
+
+
+def _health(out, health):
+    """Sensor samples from OmvHealth"""
+    for index, value in (health.sensors or {}).items():
+        out.gauge("omv_sensor_value", "Health sensor reading", value,
+                  index=index, name=health.sensor_name(index))
+
+
+def _services(out, services):
+    """Service samples from OmvServices"""
+    for service in services.entries:
+        out.gauge("omv_service_enabled", "Service is enabled",
+                  service.enabled, service=service.name)
+        out.gauge("omv_service_running", "Service is running",
+                  service.running, service=service.name)
+
+
+def exposition(utilisation, storage, health, services):
+    """Renders all snapshots in the Prometheus text format"""
+    out = _Exposition()
+    _host(out, utilisation)
+    _storage(out, storage)
+    _health(out, health)
+    _services(out, services)
+    return out.render()
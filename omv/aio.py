@@ -0,0 +1,178 @@
+"""asyncio counterpart of the Openmediavault client"""
+# -*- coding:utf-8 -*-
+import asyncio
+
+import httpx
+
+from omv.omv import Openmediavault
+
+
+class AsyncOpenmediavault(Openmediavault):
+    # pylint: disable=too-many-arguments
+    """Openmediavault client doing its RPCs on a pooled asyncio http client"""
+    def __init__(self, omv_ip, omv_port, username, password,
+                 use_https=False, debugmode=False, session_timeout=300,
+                 max_attempts=3, max_connections=10, throttle=None):
+        super().__init__(omv_ip, omv_port, username, password,
+                         use_https, debugmode, session_timeout, max_attempts,
+                         throttle)
+        self._max_connections = max_connections
+        self._client = None
+        self._asession_lock = None
+        self._inflight = {}
+    # pylint: enable=too-many-arguments
+
+    def _new_client(self):
+        """Create a keep-alive http client, its cookie jar holds the session"""
+        limits = httpx.Limits(max_connections=self._max_connections,
+                              max_keepalive_connections=self._max_connections)
+        return httpx.AsyncClient(verify=False, limits=limits)
+
+    def _get_session_lock(self):
+        """Lock serialising logins, created lazily on the running loop"""
+        if self._asession_lock is None:
+            self._asession_lock = asyncio.Lock()
+        return self._asession_lock
+
+    async def _alogin(self):
+        """Build and execute login request"""
+        return self._logged_in(
+            await self._aexecute_post_url(self._login_packet(), login=True))
+
+    async def _alogout(self):
+        """Build and execute logout request"""
+        return self._logged_out(await self._aexecute_post_url(
+            self._construct_packet("session", "logout")))
+
+    def _connected(self):
+        """Whether the http client exists"""
+        return self._client is not None
+
+    async def _aensure_session(self, expired=None):
+        """Creates a new client and logs in if needed, once for all tasks.
+
+        Returns the session generation like Openmediavault._ensure_session.
+        """
+        async with self._get_session_lock():
+            if not self._begin_login(expired):
+                return self._session_generation
+            if self._client is None:
+                self._debuglog("Creating New Session")
+                self._client = self._new_client()
+            else:
+                # Other tasks may have requests in flight, keep the
+                # connection pool and only drop the rejected cookies
+                self._client.cookies.clear()
+            return self._end_login(await self._alogin())
+
+    async def _apost_url(self, data, retry_on_error=True):
+        """Function to handle sessions for a POST request"""
+        attempts = self._max_attempts if retry_on_error else 1
+        expired = None
+        rpc = self._rpc_name(data)
+        for attempt in range(1, attempts + 1):
+            if attempt > 1:
+                await asyncio.sleep(self._throttle.backoff(attempt - 1))
+            self._check_circuit()
+            generation = await self._aensure_session(expired)
+            if generation is None:
+                continue
+
+            wait = self._throttle_wait(rpc)
+            if wait:
+                await asyncio.sleep(wait)
+
+            try:
+                response = await self._aexecute_post_url(data)
+            except httpx.HTTPError as err:
+                if attempt == attempts:
+                    raise
+                self._debuglog("Request failed: %r", err)
+                continue
+
+            if response is not None:
+                return self._answered(response)
+            expired = self._rejected(generation)
+        return None
+
+    async def _aexecute_post_url(self, data, login=False):
+        """Function to execute and handle a POST request"""
+        started = self._call_started(data)
+        status_code = result = None
+        try:
+            resp = await self._client.post(self.api_url, content=data)
+            result = self._handle_response(resp, login)
+            status_code = resp.status_code
+        finally:
+            self._call_done(data, started, status_code, result)
+        return result
+
+    async def _afetch_raw(self, group):
+        """Fetch the raw rpc.php data of a data group"""
+        if group != "storage":
+            packet = self._group_packet(group)
+            return self._response_data(await self._apost_url(packet), packet)
+        # Login once up front so the concurrent RPCs share the session,
+        # while the circuit is open only the RPCs themselves may probe
+        if not self._throttle.breaker.open:
+            await self._aensure_session()
+        packets = self._storage_packets()
+        responses = await asyncio.gather(*[
+            self._apost_url(packet) for _, packet in packets])
+        return {key: self._response_data(response, packet)
+                for (key, packet), response in zip(packets, responses)}
+
+    async def aget_smart_attributes(self, devicefile):
+        """Detailed S.M.A.R.T. attributes of one disk, None on failure.
+        Not part of any data group, smartctl may wake a sleeping disk."""
+        packet = self._construct_packet(
+            "Smart", "getAttributes", '{"devicefile":"%s"}' % devicefile)
+        response = await self._apost_url(packet)
+        if response is None:
+            return None
+        return response["response"]
+
+    async def _arefresh(self, group):
+        """Fetches a data group and swaps in the new snapshot"""
+        return self._store(group, await self._afetch_raw(group))
+
+    def _refresh_done(self, group, task):
+        """Forgets a finished fetch"""
+        self._inflight.pop(group, None)
+        if not task.cancelled():
+            # Callers that gave up waiting never see the error, mark it
+            # retrieved so asyncio does not log it as lost
+            task.exception()
+
+    async def arefresh(self, group):
+        """Fetches a data group, concurrent callers share one fetch"""
+        if group not in self.GROUPS:
+            raise ValueError("Unknown data group: %s" % group)
+        task = self._inflight.get(group)
+        if task is None:
+            task = asyncio.ensure_future(self._arefresh(group))
+            self._inflight[group] = task
+            task.add_done_callback(
+                lambda done: self._refresh_done(group, done))
+        # A cancelled caller must not cancel the fetch the others wait on
+        return await asyncio.shield(task)
+
+    async def get(self, group):
+        """Returns the snapshot of a data group, fetching it if needed"""
+        if group not in self.GROUPS:
+            raise ValueError("Unknown data group: %s" % group)
+        snapshot = getattr(self, "_" + group)
+        if snapshot is None:
+            snapshot = await self.arefresh(group)
+        return snapshot
+
+    async def aclose(self):
+        """Cancels in-flight fetches and closes the http client"""
+        inflight = list(self._inflight.values())
+        for task in inflight:
+            task.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.close()
@@ -1,9 +1,24 @@
 """Module containing multiple classes to interact with openmediavault
 based on StaticCube https://github.com/StaticCube/python-synology"""
 # -*- coding:utf-8 -*-
+import collections
+import threading
+import time
+
 import requests
 import urllib3
 
+from omv.ratelimit import CircuitOpenError, RpcThrottle
+from omv.stats import RpcStats
+
+
+class RpcError(Exception):
+    """An rpc.php call gave no data after every attempt"""
+
+
+class AuthenticationError(RpcError):
+    """OpenMediaVault rejected the username or password"""
+
 
 class FormatHelper(object):
     """Class containing various formatting functions"""
@@ -42,103 +57,264 @@ class FormatHelper(object):
 
         return round(var_tb, 1)
 
+def _to_number(value):
+    """Parses a raw OMV value to an int or float, unchanged if not numeric"""
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _split_load(load_average):
+    """The three loads of loadAverage as sent, a dict on OMV 5 and a string
+    before"""
+    if isinstance(load_average, dict):
+        return tuple(load_average.get(period)
+                     for period in ("1min", "5min", "15min"))
+    loads = str(load_average).split(', ')
+    return tuple((loads + [None, None, None])[0:3])
+
+
+def _parse_load(load_average):
+    """Parses the three loads of loadAverage to numbers"""
+    return tuple(_to_number(load) for load in _split_load(load_average))
+
+
+class HostInfo(collections.namedtuple("HostInfo", [
+        "hostname", "version", "processor", "kernel", "time", "uptime",
+        "load_1min", "load_5min", "load_15min", "cpu_usage", "mem_total",
+        "mem_free", "mem_used", "config_dirty", "reboot_required",
+        "pkg_updates_available"])):
+    """Host record from System.getInformation"""
+    __slots__ = ()
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a System.getInformation response"""
+        load_1min, load_5min, load_15min = _parse_load(raw['loadAverage'])
+        return cls(
+            hostname=raw['hostname'],
+            version=raw['version'],
+            processor=raw['cpuModelName'],
+            kernel=raw['kernel'],
+            time=raw['time'],
+            uptime=raw['uptime'],
+            load_1min=load_1min,
+            load_5min=load_5min,
+            load_15min=load_15min,
+            cpu_usage=_to_number(raw['cpuUsage']),
+            mem_total=_to_number(raw['memTotal']),
+            mem_free=_to_number(raw['memFree']),
+            mem_used=_to_number(raw['memUsed']),
+            config_dirty=raw['configDirty'],
+            reboot_required=raw['rebootRequired'],
+            pkg_updates_available=raw['pkgUpdatesAvailable'])
+
+
+class Volume(collections.namedtuple("Volume", [
+        "devicefile", "parentdevicefile", "mounted", "size", "available"])):
+    """Filesystem record from FileSystemMgmt.enumerateFilesystems"""
+    __slots__ = ()
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a filesystem entry"""
+        return cls(
+            devicefile=raw["devicefile"],
+            parentdevicefile=raw.get("parentdevicefile"),
+            mounted=raw.get("mounted", False),
+            size=int(raw.get("size") or 0),
+            available=int(raw.get("available") or 0))
+
+    @property
+    def used(self):
+        """Used bytes"""
+        return self.size - self.available
+
+
+class Raid(collections.namedtuple("Raid", [
+        "devicefile", "name", "level", "state", "devices"])):
+    """Raid record from RaidMgmt.enumerateDevices"""
+    __slots__ = ()
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a raid entry"""
+        return cls(
+            devicefile=raw["devicefile"],
+            name=raw.get("name"),
+            level=raw.get("level"),
+            state=raw.get("state"),
+            devices=tuple(raw.get("devices", ())))
+
+
+class Disk(collections.namedtuple("Disk", [
+        "devicefile", "model", "status", "temperature"])):
+    """Disk record from Smart.enumerateDevices"""
+    __slots__ = ()
+
+    @staticmethod
+    def _parse_temperature(temperature):
+        """Parses a temperature like '35°C'"""
+        if isinstance(temperature, int):
+            return temperature
+        try:
+            return int(temperature[0:-2])
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a S.M.A.R.T. device entry"""
+        return cls(
+            devicefile=raw["devicefile"],
+            model=raw.get("model"),
+            status=raw.get("overallstatus"),
+            temperature=cls._parse_temperature(raw.get("temperature")))
+
+
+class Sensor(collections.namedtuple("Sensor", ["index", "name", "value"])):
+    """Sensor record from Health.getHealthInfo"""
+    __slots__ = ()
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a sensor entry"""
+        return cls(index=raw["index"], name=raw["name"],
+                   value=_to_number(raw["value"]))
+
+
+class Service(collections.namedtuple("Service", [
+        "name", "title", "enabled", "running"])):
+    """Service record from Services.getStatus"""
+    __slots__ = ()
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Parses a service entry"""
+        return cls(name=raw.get("name"), title=raw.get("title"),
+                   enabled=raw.get("enabled"), running=raw.get("running"))
+
+
 class OmvUtilization(object):
-    """Class containing Utilisation data"""
+    """Class containing Utilisation data. The accessors return the parsed
+    HostInfo values, detailed_host and load_average the values as OMV sent
+    them."""
     def __init__(self, raw_input):
         self._data = None
+        self._raw = None
         self.update(raw_input)
 
     def update(self, raw_input):
         """Allows updating Utilisation data with raw_input data"""
         if raw_input is not None:
-            self._data = {}
-            for val in raw_input:
-                self._data["hostname"] = raw_input['hostname']
-                self._data["version"] = raw_input['version']
-                self._data["processor"] = raw_input['cpuModelName']
-                self._data["kernel"] = raw_input['kernel']
-                self._data["time"] = raw_input['time']
-                self._data["uptime"] = raw_input['uptime']
-                self._data["loadAverage"] = raw_input['loadAverage']
-                self._data["cpuUsage"] = raw_input['cpuUsage']
-                self._data["memTotal"] = raw_input['memTotal']
-                self._data["memFree"] = raw_input['memFree']
-                self._data["memUsed"] = raw_input['memUsed']
-                self._data["configDirty"] = raw_input['configDirty']
-                self._data["rebootRequired"] = raw_input['rebootRequired']
-                self._data["pkgUpdatesAvailable"] = raw_input['pkgUpdatesAvailable']
+            self._data = HostInfo.from_raw(raw_input)
+            self._raw = raw_input
+
+    @property
+    def host(self):
+        """The HostInfo record"""
+        return self._data
 
     @property
     def detailed_host(self):
         """Returns all host data of openmediavault"""
-        if self._data is not None:
-            return (self._data)
+        if self._raw is not None:
+            return {
+                "hostname": self._raw['hostname'],
+                "version": self._raw['version'],
+                "processor": self._raw['cpuModelName'],
+                "kernel": self._raw['kernel'],
+                "time": self._raw['time'],
+                "uptime": self._raw['uptime'],
+                "loadAverage": self._raw['loadAverage'],
+                "cpuUsage": self._raw['cpuUsage'],
+                "memTotal": self._raw['memTotal'],
+                "memFree": self._raw['memFree'],
+                "memUsed": self._raw['memUsed'],
+                "configDirty": self._raw['configDirty'],
+                "rebootRequired": self._raw['rebootRequired'],
+                "pkgUpdatesAvailable": self._raw['pkgUpdatesAvailable'],
+            }
+
+    @property
+    def load_average(self):
+        """The 1min, 5min and 15min loads as sent"""
+        if self._raw is not None:
+            return dict(zip(("1min", "5min", "15min"),
+                            _split_load(self._raw['loadAverage'])))
 
     @property
     def hostname(self):
         """Hostname of openmediavault"""
         if self._data is not None:
-            return self._data["hostname"]
+            return self._data.hostname
 
     @property
     def memTotal(self):
         """memTotal of openmediavault"""
         if self._data is not None:
-            return self._data["memTotal"]
+            return self._data.mem_total
 
     @property
     def memFree(self):
         """memFree of openmediavault"""
         if self._data is not None:
-            return self._data["memFree"]
+            return self._data.mem_free
 
     @property
     def memUsed(self):
         """memUsed of openmediavault"""
         if self._data is not None:
-            return self._data["memUsed"]
+            return self._data.mem_used
 
     @property
     def kernel(self):
         """kernel of openmediavault"""
         if self._data is not None:
-            return self._data["kernel"]
+            return self._data.kernel
 
     @property
     def processor(self):
         """processor of openmediavault"""
         if self._data is not None:
-            return self._data["processor"]
+            return self._data.processor
 
     @property
     def pkgUpdatesAvailable(self):
         """pkgUpdatesAvailable of openmediavault"""
         if self._data is not None:
-            return self._data["pkgUpdatesAvailable"]
+            return self._data.pkg_updates_available
 
     @property
     def version(self):
         """version of openmediavault"""
         if self._data is not None:
-            return self._data["version"]
+            return self._data.version
 
     @property
     def rebootRequired(self):
         """rebootRequired of openmediavault"""
         if self._data is not None:
-            return self._data["rebootRequired"]
+            return self._data.reboot_required
 
     @property
     def configDirty(self):
         """configDirty of openmediavault"""
         if self._data is not None:
-            return self._data["configDirty"]
+            return self._data.config_dirty
 
     @property
     def up_time(self):
         """Get uptime"""
         if self._data is not None:
-            return self._data["uptime"]
+            return self._data.uptime
 
     # @property
     # def cpu_other_load(self):
@@ -162,48 +338,82 @@ class OmvUtilization(object):
     def cpu_total_load(self):
         """Total CPU load for openmediavault"""
         if self._data is not None:
-            return self._data["cpuUsage"]
+            return self._data.cpu_usage
 
     def _get_cpu_avg_load(self):
         """Get avg load and parse"""
         if self._data is not None:
-            #return self._data["loadAverage"].split(', ')
-            return self._data["loadAverage"]
+            return {
+                "1min": self._data.load_1min,
+                "5min": self._data.load_5min,
+                "15min": self._data.load_15min,
+            }
 
     @property
     def cpu_1min_load(self):
         """Average CPU load past minute"""
-        #return self._get_cpu_avg_load()[0]
-        return self._get_cpu_avg_load()['1min']
+        if self._data is not None:
+            return self._data.load_1min
 
     @property
     def cpu_5min_load(self):
         """Average CPU load past 5 minutes"""
-        #return self._get_cpu_avg_load()[1]
-        return self._get_cpu_avg_load()['5min']
+        if self._data is not None:
+            return self._data.load_5min
 
     @property
     def cpu_15min_load(self):
         """Average CPU load past 15 minutes"""
-        #return self._get_cpu_avg_load()[2]
-        return self._get_cpu_avg_load()['15min']
+        if self._data is not None:
+            return self._data.load_15min
 
     @property
     def memory_real_usage(self):
         """Get mem usage"""
         if self._data is not None:
-            return self._data["memUsed"]
+            return self._data.mem_used
 
 class OmvStorage(object):
     """Class containing Storage data"""
     def __init__(self, raw_input):
         self._data = None
+        self._volume_index = {}
+        self._raid_index = {}
+        self._disk_index = {}
+        self._raid_disks = {}
+        self._disk_raid = {}
         self.update(raw_input)
 
     def update(self, raw_input):
         """Allows updating Utilisation data with raw_input data"""
         if raw_input is not None:
             self._data = raw_input
+            self._build_indexes()
+
+    def _build_indexes(self):
+        """Parse volumes, raids and disks into records indexed by devicefile
+        and resolve which disks make up each raid, once per snapshot"""
+        self._volume_index = {}
+        for volume in self._data["volumes"]:
+            volume = Volume.from_raw(volume)
+            self._volume_index.setdefault(volume.devicefile, volume)
+
+        self._raid_index = {}
+        self._raid_disks = {}
+        self._disk_raid = {}
+        for raid in self._data["raid"]:
+            raid = Raid.from_raw(raid)
+            self._raid_index.setdefault(raid.devicefile, raid)
+            # Raid members are partitions, strip the partition number
+            member_disks = tuple(device[0:-1] for device in raid.devices)
+            self._raid_disks.setdefault(raid.devicefile, member_disks)
+            for disk in member_disks:
+                self._disk_raid.setdefault(disk, raid.devicefile)
+
+        self._disk_index = {}
+        for disk in self._data["smart"]:
+            disk = Disk.from_raw(disk)
+            self._disk_index.setdefault(disk.devicefile, disk)
 
     @property
     def detailed_storage(self):
@@ -221,42 +431,38 @@ class OmvStorage(object):
             return volumes
 
     def _get_volume(self, volume_devicefile):
-        """Returns a specific volume"""
-        if self._data is not None:
-            for volume in self._data["volumes"]:
-                if volume["devicefile"] == volume_devicefile:
-                    return volume
+        """Returns a specific Volume record"""
+        return self._volume_index.get(volume_devicefile)
 
     def volume_status(self, volume):
         """Status of the volume (clean etc.)"""
         volume = self._get_volume(volume)
-        raid = self._get_raid(volume["devicefile"])
-        if volume is not None and raid is not None:
-            return raid["state"]
+        if volume is not None:
+            raid = self._get_raid(volume.devicefile)
+            if raid is not None:
+                return raid.state
 
     def volume_device_type(self, volume):
         """Returns the volume type (RAID1, RAID2, etc)"""
         volume = self._get_volume(volume)
-        try:
-            raid = self._get_raid(volume["devicefile"])
-            if volume is not None and raid is not None:
-                return raid["level"]
-        except KeyError:
-            pass
+        if volume is not None:
+            raid = self._get_raid(volume.devicefile)
+            if raid is not None:
+                return raid.level
         return None
 
-    def _volume_mounted(self, volume):
+    def volume_mounted(self, volume):
         """Returns boolean if mounted"""
         volume = self._get_volume(volume)
         if volume is not None:
-            return volume["mounted"]
+            return volume.mounted
         return False
 
     def volume_size_total(self, volume, human_readable=True):
         """Total size of volume"""
         volume = self._get_volume(volume)
-        if volume is not None and self._volume_mounted(volume["devicefile"]):
-            return_data = int(volume["size"])
+        if volume is not None and volume.mounted:
+            return_data = volume.size
             if human_readable:
                 return FormatHelper.bytes_to_readable(
                     return_data)
@@ -266,8 +472,8 @@ class OmvStorage(object):
     def volume_size_used(self, volume, human_readable=True):
         """Total used size in volume"""
         volume = self._get_volume(volume)
-        if volume is not None and self._volume_mounted(volume["devicefile"]):
-            return_data = int(int(volume["size"])-int(volume["available"]))
+        if volume is not None and volume.mounted:
+            return_data = volume.used
             if human_readable:
                 return FormatHelper.bytes_to_readable(
                     return_data)
@@ -278,51 +484,44 @@ class OmvStorage(object):
         """Total used size in percentage for volume"""
         volume = self._get_volume(volume)
         if volume is not None:
-            total = int(volume["size"])
-            used = int(int(volume["size"])-int(volume["available"]))
+            total = volume.size
+            used = volume.used
 
             if used is not None and used > 0 and \
                total is not None and total > 0:
                 return round((float(used) / float(total)) * 100.0, 1)
 
+    def _volume_disk_temps(self, volume):
+        """Temperatures of the member disks of a raid volume"""
+        temps = []
+        for disk in self._raid_disks.get(volume.devicefile, ()):
+            disk_temp = self.disk_temp(disk)
+            if disk_temp is not None:
+                temps.append(disk_temp)
+        return temps
+
     def volume_disk_temp_avg(self, volume):
         """Average temperature of all disks making up the volume"""
         volume = self._get_volume(volume)
         if volume is not None:
-            if self.volume_device_type(volume["devicefile"]) is None:
-                return self.disk_temp(volume["parentdevicefile"])
-
-            vol_disks = self._get_raid(volume["devicefile"])
-            if vol_disks is not None:
-                total_temp = 0
-                total_disks = 0
-
-                for vol_raid in vol_disks["devices"]:
-                    disk_temp = self.disk_temp(vol_raid[0:-1])
-                    if disk_temp is not None:
-                        total_disks += 1
-                        total_temp += disk_temp
+            if self.volume_device_type(volume.devicefile) is None:
+                return self.disk_temp(volume.parentdevicefile)
 
-                if total_temp > 0 and total_disks > 0:
-                    return int(round(total_temp / total_disks, 0))
+            if volume.devicefile in self._raid_disks:
+                temps = self._volume_disk_temps(volume)
+                total_temp = sum(temps)
+                if total_temp > 0 and temps:
+                    return int(round(total_temp / len(temps), 0))
 
     def volume_disk_temp_max(self, volume):
         """Maximum temperature of all disks making up the volume"""
         volume = self._get_volume(volume)
         if volume is not None:
-            if self.volume_device_type(volume["devicefile"]) is None:
-                return self.disk_temp(volume["parentdevicefile"])
+            if self.volume_device_type(volume.devicefile) is None:
+                return self.disk_temp(volume.parentdevicefile)
 
-            vol_disks = self._get_raid(volume["devicefile"])
-            if vol_disks is not None:
-                max_temp = 0
-
-                for vol_raid in vol_disks["devices"]:
-                    disk_temp = self.disk_temp(vol_raid[0:-1])
-                    if disk_temp is not None and disk_temp > max_temp:
-                        max_temp = disk_temp
-
-                return max_temp
+            if volume.devicefile in self._raid_disks:
+                return max([0] + self._volume_disk_temps(volume))
 
     @property
     def raids(self):
@@ -334,34 +533,39 @@ class OmvStorage(object):
             return raids
 
     def _get_raid(self, raid_devicefile):
-        """Returns a specific raid"""
-        if self._data is not None:
-            for raid in self._data["raid"]:
-                if raid["devicefile"] == raid_devicefile:
-                    return raid
+        """Returns a specific Raid record"""
+        return self._raid_index.get(raid_devicefile)
 
     def raid_name(self, raid):
         """The name of this raid"""
         raid = self._get_raid(raid)
         if raid is not None:
-            return raid["name"]
+            return raid.name
+
+    def raid_level(self, raid):
+        """The level of this raid, e.g. raid1"""
+        raid = self._get_raid(raid)
+        if raid is not None:
+            return raid.level
+
+    def raid_state(self, raid):
+        """The state of this raid, e.g. clean or clean, degraded"""
+        raid = self._get_raid(raid)
+        if raid is not None:
+            return raid.state
 
     def raid_devices(self, raid):
         """The devices of this raid"""
         raid = self._get_raid(raid)
         if raid is not None:
-            devices = []
-            for device in raid["devices"]:
-                devices.append(device)
-            return devices
+            return list(raid.devices)
 
     def devicefile_from_raid(self, disk):
         """Get raid of disk"""
-        for raid in self.raids:
-            for device in self.raid_devices(raid):
-                if device[0:-1] == disk["devicefile"]:
-                    return raid
-
+        raid = self._disk_raid.get(disk["devicefile"])
+        if raid is None and self._data["raid"]:
+            # Disks outside any raid have always resolved to the last raid
+            raid = self._data["raid"][-1]["devicefile"]
         return raid
 
     @property
@@ -374,112 +578,167 @@ class OmvStorage(object):
             return disks
 
     def _get_disk(self, disk_devicefile):
-        """Returns a specific disk"""
-        if self._data is not None:
-            for disk in self._data["smart"]:
-                if disk["devicefile"] == disk_devicefile:
-                    return disk
+        """Returns a specific Disk record"""
+        return self._disk_index.get(disk_devicefile)
 
     def disk_name(self, disk):
         """The name of this disk"""
         disk = self._get_disk(disk)
         if disk is not None:
-            return disk["model"]
+            return disk.model
 
     def disk_smart_status(self, disk):
         """Status of disk according to S.M.A.R.T)"""
         disk = self._get_disk(disk)
         if disk is not None:
-            return disk["overallstatus"]
+            return disk.status
 
     def disk_temp(self, disk):
         """Returns the temperature of the disk"""
         disk = self._get_disk(disk)
         if disk is not None:
-            try:
-                return int(disk["temperature"][0:-2])
-            except ValueError:
-                pass
-            else:
-                return int(disk["temperature"])
+            return disk.temperature
         return None
 
 class OmvHealth(object):
     """Class containing health data"""
     def __init__(self, raw_input):
         self._data = None
+        self._sent = {}
         self.update(raw_input)
 
     def update(self, raw_input):
         """Allows updating health data with raw_input data"""
         if raw_input is not None:
-            self._data = raw_input
+            self._data = {}
+            self._sent = {}
+            for raw in raw_input:
+                sensor = Sensor.from_raw(raw)
+                self._data.setdefault(sensor.index, sensor)
+                self._sent.setdefault(sensor.index, raw["value"])
+
+    @property
+    def sensors(self):
+        """Returns the value of every sensor keyed by index"""
+        if self._data is not None:
+            sensors = {}
+            for sensor in self._data.values():
+                sensors[sensor.index] = sensor.value
+            return sensors
+
+    def sent_value(self, index):
+        """Returns the value of a sensor as OMV sent it"""
+        return self._sent.get(index)
+
+    def sensor_name(self, index):
+        """Returns the name of a sensor"""
+        sensor = self._data.get(index) if self._data is not None else None
+        if sensor is not None:
+            return sensor.name
 
     @property
     def temp(self):
         """Returns all available temperatures"""
         if self._data is not None:
             temps = []
-            for temp in self._data:
-                if "temperature" in temp["name"]:
-                    temps.append(temp["index"])
+            for temp in self._data.values():
+                if "temperature" in temp.name:
+                    temps.append(temp.index)
             return temps
 
     def _get_temp(self, temp_index):
         """Returns a specific temperature device"""
         if self._data is not None:
-            for temp in self._data:
-                if temp["index"] == temp_index:
-                    return temp
+            return self._data.get(temp_index)
 
     def temp_value(self, temp):
         """Returns a specific temperature"""
         temp = self._get_temp(temp)
         if temp is not None:
-            return temp["value"]
+            return temp.value
 
     @property
     def fan(self):
         """Returns all available fan speeds"""
         if self._data is not None:
             fans = []
-            for fan in self._data:
-                if "Fan" in fan["name"]:
-                    fans.append(fan["index"])
+            for fan in self._data.values():
+                if "Fan" in fan.name:
+                    fans.append(fan.index)
             return fans
 
     def _get_fan(self, fan_index):
         """Returns a specific fan speed device"""
         if self._data is not None:
-            for fan in self._data:
-                if fan["index"] == fan_index:
-                    return fan
+            return self._data.get(fan_index)
 
     def fan_value(self, fan):
         """Returns a specific fan"""
         fan = self._get_fan(fan)
         if fan is not None:
-            return fan["value"]
+            return fan.value
 
 class OmvServices(object):
     def __init__(self, raw_input):
         self._data = None
+        self._entries = ()
         self.update(raw_input)
 
     def update(self, raw_input):
         if raw_input is not None:
             self._data = raw_input
+            service_list = raw_input
+            # Some OMV versions wrap the list in {"total": n, "data": [...]}
+            if isinstance(service_list, dict):
+                service_list = service_list.get("data", [])
+            self._entries = tuple(
+                Service.from_raw(service) for service in service_list)
 
     @property
     def service(self):
         """Returns all available crons"""
         return(self._data)
 
+    @property
+    def entries(self):
+        """Service records"""
+        return self._entries
+
 class Openmediavault():
     # pylint: disable=too-many-arguments,too-many-instance-attributes
-    """Class containing the main openmediavault functions"""
+    """Class containing the main openmediavault functions.
+
+    A blocking client for scripts, and the base of AsyncOpenmediavault the
+    api runs on: packets, sessions, limits and responses are handled here,
+    the subclass only replaces the http calls.
+    """
+    GROUPS = ("utilisation", "storage", "health", "services")
+    GROUP_MODELS = {
+        "utilisation": OmvUtilization,
+        "storage": OmvStorage,
+        "health": OmvHealth,
+        "services": OmvServices,
+    }
+    # rpc.php call behind each single-call data group
+    GROUP_RPCS = {
+        "utilisation": ("System", "getInformation"),
+        "health": ("Health", "getHealthInfo"),
+        "services": ("services", "getStatus"),
+    }
+    # rpc.php error codes meaning the session expired or is invalid
+    SESSION_ERROR_CODES = frozenset({0, 105, 106, 107, 119, 5000, 5001})
+    # Independent RPCs making up the storage data, fetched concurrently by
+    # AsyncOpenmediavault
+    STORAGE_RPCS = (
+        ("volumes", "FileSystemMgmt", "enumerateFilesystems"),
+        ("smart", "Smart", "enumerateDevices"),
+        ("raid", "RaidMgmt", "enumerateDevices"),
+        ("disk", "DiskMgmt", "enumerateDevices"),
+    )
+
     def __init__(self, omv_ip, omv_port, username, password,
-                 use_https=False, debugmode=False):
+                 use_https=False, debugmode=False, session_timeout=300,
+                 max_attempts=3, throttle=None):
         # Store Variables
         self.username = username
         self.password = password
@@ -491,12 +750,28 @@ class Openmediavault():
         self._storage = None
         self._health = None
         self._services = None
+        self._fetched = {}
+        self._versions = {}
+        self._raw = {}
+        self._restored = set()
+        self._listeners = []
         self._debugmode = debugmode
         self._use_https = use_https
 
         # Define Session
         self._session_error = False
+        self._login_rejected = False
         self._session = None
+        self._session_lock = threading.Lock()
+        self._session_generation = 0
+        self._session_used = 0
+        # OMV expires sessions idle for longer than its timeout, log in
+        # again a little before that instead of waiting for an error
+        self._session_max_idle = session_timeout * 0.9
+        self._max_attempts = max(1, max_attempts)
+        self.stats = RpcStats()
+        # Bounds the load put on the NAS however many callers there are
+        self._throttle = throttle if throttle is not None else RpcThrottle()
 
         # Build Variables
         if self._use_https:
@@ -509,204 +784,388 @@ class Openmediavault():
             self.api_url = "http://%s:%s/rpc.php" % (omv_ip, omv_port)
     # pylint: enable=too-many-arguments,too-many-instance-attributes
 
-    def _debuglog(self, message):
-        """Outputs message if debug mode is enabled"""
+    def _debuglog(self, message, *args):
+        """Outputs message if debug mode is enabled, formatting it with
+        args only then so big responses cost nothing otherwise"""
         if self._debugmode:
+            if args:
+                message = message % args
             print("DEBUG: " + message + "\n")
 
+    @staticmethod
+    def _rpc_name(data):
+        """'service.method' of a packet built by _construct_packet"""
+        parts = data.split('"', 8)
+        return "%s.%s" % (parts[3], parts[7])
+
     def _construct_packet(self, service, method, params="null"):
         """Construct message string."""
         return '{"service":"%s","method":"%s","params":%s}' % \
             (service, method, params)
 
-    def _login(self):
-        """Build and execute login request"""
+    def _login_packet(self):
+        """session.login packet carrying the credentials"""
         credentials = '{"username":"%s","password":"%s"}' % \
             (self.username, self.password)
-        login_packet = self._construct_packet("session", "login", credentials)
-
-        result = self._execute_post_url(login_packet)
+        return self._construct_packet("session", "login", credentials)
 
-        # Parse Result if valid
+    def _logged_in(self, result):
+        """Keeps the cookies of a login response, whether it succeeded"""
         if result is not None:
             self.cookies = result.cookies
-            self._debuglog("Authentication Succesfull, cookie: " +
-                           str(self.cookies))
+            self._debuglog("Authentication Succesfull, cookie: %s",
+                           self.cookies)
             return True
-        else:
-            self._debuglog("Authentication Failed")
-            return False
-
-    def _logout(self):
-        """Build and execute logout request"""
-        logout_packet = self._construct_packet("session", "logout")
-
-        result = self._execute_post_url(logout_packet)
+        self._debuglog("Authentication Failed")
+        return False
 
-        # Parse Result if valid
+    def _logged_out(self, result):
+        """Whether a logout response means success"""
         if result is not None:
             self._debuglog("Logout Succesfull")
             return True
-        else:
-            self._debuglog("Logout Failed")
-            return False
+        self._debuglog("Logout Failed")
+        return False
 
-    def _post_url(self, data, retry_on_error=True):
-        """Function to handle sessions for a GET request"""
-        # Check if we failed to request the url or need to login
-        if self.cookies is None or \
-           self._session is None or \
-           self._session_error:
-            # Clear Access Token en reset session error
-            # self.access_token = None
-            self.cookies = None
-            self._session_error = False
-
-            # First Reset the session
-            if self._session is not None:
-                self._session = None
-            self._debuglog("Creating New Session")
-            self._session = requests.Session()
-
-            # disable SSL certificate verification
-            if self._use_https:
-                self._session.verify = False
-
-            # We Created a new Session so login
-            if self._login() is False:
-                self._session_error = True
-                self._debuglog("Login Failed, unable to process request")
-                return
-
-        # Now request the data
-        response = self._execute_post_url(data)
-        if (self._session_error or response is None) and retry_on_error:
-            self._debuglog("Response: " + str(response))
-            self._debuglog("Error occured, retrying...")
-            self._post_url(data, False)
+    def _login(self):
+        """Build and execute login request"""
+        return self._logged_in(
+            self._execute_post_url(self._login_packet(), login=True))
 
+    def _logout(self):
+        """Build and execute logout request"""
+        return self._logged_out(self._execute_post_url(
+            self._construct_packet("session", "logout")))
+
+    def _connected(self):
+        """Whether the http session exists"""
+        return self._session is not None
+
+    def _session_expired(self, expired):
+        """Whether a new session and login are needed"""
+        return self.cookies is None or \
+            not self._connected() or \
+            expired == self._session_generation or \
+            time.monotonic() - self._session_used > self._session_max_idle
+
+    def _begin_login(self, expired):
+        """Whether a login is needed, dropping the rejected cookies if so"""
+        if not self._session_expired(expired):
+            return False
+        self.cookies = None
+        self._session_error = False
+        self._login_rejected = False
+        self.stats.event("relogin" if self._session_generation else "login")
+        return True
+
+    def _end_login(self, logged_in):
+        """Generation of the new session, None if the login failed. Raises
+        AuthenticationError if the credentials were rejected, retrying
+        cannot help then."""
+        if self._login_rejected:
+            self.stats.event("login_rejected")
+            raise AuthenticationError(
+                "OpenMediaVault rejected the login of %s" % self.username)
+        if not logged_in:
+            self._session_error = True
+            self.stats.event("login_failed")
+            self._debuglog("Login Failed, unable to process request")
+            return None
+        self._session_generation += 1
+        self._session_used = time.monotonic()
+        return self._session_generation
+
+    def _ensure_session(self, expired=None):
+        """Creates a new session and logs in if needed, once for all threads.
+
+        Returns the generation of the session to use, None if the login
+        failed. Passing the generation a request was rejected with logs in
+        again unless another thread already did.
+        """
+        with self._session_lock:
+            if not self._begin_login(expired):
+                return self._session_generation
+            if self._session is None:
+                self._debuglog("Creating New Session")
+                self._session = requests.Session()
+                # disable SSL certificate verification
+                if self._use_https:
+                    self._session.verify = False
+            else:
+                # Other threads may have requests in flight, keep the
+                # connection pool and only drop the rejected cookies
+                self._session.cookies.clear()
+            return self._end_login(self._login())
+
+    def _check_circuit(self):
+        """Raises CircuitOpenError while the NAS is given time to recover"""
+        if not self._throttle.breaker.allow():
+            self.stats.event("circuit_rejected")
+            raise CircuitOpenError(
+                "OpenMediaVault failed repeatedly, not calling it for now")
+
+    def _throttle_wait(self, rpc):
+        """Seconds to wait before sending an rpc within the rate limit"""
+        wait = self._throttle.reserve(rpc)
+        if wait:
+            self.stats.event("throttled")
+        return wait
+
+    def _answered(self, response):
+        """Marks the session as used by a successful rpc"""
+        self._session_used = time.monotonic()
         return response
 
-    def _execute_post_url(self, data):
-        """Function to execute and handle a GET request"""
-        # Prepare Request
-        self._debuglog(
-            "Requesting URL: '" + self.api_url + "', msg: '" + data + "'")
-        # Execute Request
+    def _rejected(self, generation):
+        """The session generation to log out of after an rpc got no data,
+        None unless rpc.php reported a session error"""
+        self._debuglog("Error occured, retrying...")
+        if self._session_error:
+            return generation
+        return None
+
+    def _post_url(self, data, retry_on_error=True):
+        """Function to handle sessions for a POST request"""
+        attempts = self._max_attempts if retry_on_error else 1
+        expired = None
+        rpc = self._rpc_name(data)
+        for attempt in range(1, attempts + 1):
+            if attempt > 1:
+                time.sleep(self._throttle.backoff(attempt - 1))
+            self._check_circuit()
+            generation = self._ensure_session(expired)
+            if generation is None:
+                continue
+
+            wait = self._throttle_wait(rpc)
+            if wait:
+                time.sleep(wait)
+
+            # Now request the data
+            try:
+                response = self._execute_post_url(data)
+            except requests.RequestException as err:
+                if attempt == attempts:
+                    raise
+                self._debuglog("Request failed: %r", err)
+                continue
+
+            if response is not None:
+                return self._answered(response)
+            expired = self._rejected(generation)
+        return None
+
+    def _call_started(self, data):
+        """Logs an rpc.php call, returns its start time"""
+        self._debuglog("Requesting URL: '%s', msg: '%s'", self.api_url, data)
+        return time.monotonic()
+
+    def _call_done(self, data, started, status_code, result):
+        """Reports an rpc.php call to the circuit breaker and the stats.
+
+        status_code is None when the call raised, a non-JSON page or a
+        cancelled call included, so a breaker probe always reports back.
+        rpc.php errors are answers, only an overloaded server counts.
+        """
+        upstream_failed = status_code is None or status_code >= 500
+        if not upstream_failed:
+            self._throttle.breaker.success()
+        elif self._throttle.breaker.failure():
+            self.stats.event("circuit_opened")
+            self._debuglog("Circuit opened, OpenMediaVault keeps failing")
+        self.stats.observe(self._rpc_name(data), time.monotonic() - started,
+                           failed=upstream_failed or result is None)
+
+    def _execute_post_url(self, data, login=False):
+        """Function to execute and handle a POST request"""
+        started = self._call_started(data)
+        status_code = result = None
         try:
             resp = self._session.post(
                 self.api_url, cookies=self.cookies, data=data, verify=False)
-            self._debuglog("Request executed: " + str(resp.status_code))
+            result = self._handle_response(resp, login)
+            status_code = resp.status_code
+        finally:
+            self._call_done(data, started, status_code, result)
+        return result
+
+    def _handle_response(self, resp, login):
+        """Parses a rpc.php response, flagging session errors"""
+        try:
+            self._debuglog("Request executed: %s", resp.status_code)
 
+            if login and resp.status_code == 401:
+                self._login_rejected = True
+                return None
             if resp.status_code == 200:
                 # We got a response
                 json_data = resp.json()
-                self._debuglog("Response (200): " + str(json_data))
-                if self.cookies is None and resp.ok:
-                    if json_data["response"]["authenticated"]:
+                self._debuglog("Response (200): %s", json_data)
+                if login:
+                    # A rejected login answers {"response": null, "error":
+                    # {...}}, an answer and no reason to open the circuit
+                    if (json_data.get("response") or {}).get(
+                            "authenticated"):
                         self._debuglog("Succesfull returning login data")
-                        self._debuglog("Login: " + str(json_data))
+                        self._debuglog("Login: %s", json_data)
                         return resp
+                    self._debuglog("Login rejected: %s",
+                                   json_data.get("error"))
+                    self._login_rejected = True
                 elif json_data['error'] is None:
                     self._debuglog("Succesfull returning data")
-                    self._debuglog("Data returned: " + str(json_data))
+                    self._debuglog("Data returned: %s", json_data)
                     return json_data
                 else:
+                    self.stats.error_code(json_data["error"]["code"])
                     if json_data["error"]["code"] in \
-                            {0, 105, 106, 107, 119, 5000, 5001}:
-                        self._debuglog("Session error: " +
-                                       str(json_data["error"]["code"]))
+                            self.SESSION_ERROR_CODES:
+                        self._debuglog("Session error: %s",
+                                       json_data["error"]["code"])
                         self._session_error = True
                     else:
-                        self._debuglog("Failed: " + resp.text)
+                        self._debuglog("Failed: %s", resp.text)
             else:
                 # We got a 404 or 401
                 self._debuglog("Error: 404 or 401")
                 return None
         # pylint: disable=bare-except
-        except KeyError:
-            self._debuglog("Error: KeyError")
+        except (KeyError, TypeError) as err:
+            # Valid JSON without the expected layout
+            self._debuglog("Error: %r", err)
             return None
         # pylint: enable=bare-except
 
-    def update(self):
-        """Updates the various instanced modules"""
-        if self._utilisation is not None:
-            packet = self._construct_packet("System", "getInformation")
-            self._utilisation.update(self._post_url(packet)["response"])
-        if self._storage is not None:
-            json_response = {}
-            json_response['volumes'] = \
-                self._post_url(self._construct_packet(
-                    "FileSystemMgmt", "enumerateFilesystems"))["response"]
+    def close(self):
+        """Releases the http session"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def _storage_packets(self):
+        """Key in the storage data and packet of every storage RPC"""
+        return [(key, self._construct_packet(service, method))
+                for key, service, method in self.STORAGE_RPCS]
+
+    def _group_packet(self, group):
+        """Packet of the RPC behind a single-call data group"""
+        service, method = self.GROUP_RPCS[group]
+        return self._construct_packet(service, method)
+
+    def _response_data(self, response, packet):
+        """The data of a rpc.php response, raises RpcError if the call gave
+        none"""
+        if response is None:
+            raise RpcError("%s gave no data after %d attempts"
+                           % (self._rpc_name(packet), self._max_attempts))
+        return response["response"]
+
+    def _fetch_raw(self, group):
+        """Fetch the raw rpc.php data of a data group"""
+        if group == "storage":
+            return {key: self._response_data(self._post_url(packet), packet)
+                    for key, packet in self._storage_packets()}
+        packet = self._group_packet(group)
+        return self._response_data(self._post_url(packet), packet)
+
+    def refresh(self, group):
+        """Fetches a data group and swaps in the new snapshot"""
+        if group not in self.GROUPS:
+            raise ValueError("Unknown data group: %s" % group)
+        return self._store(group, self._fetch_raw(group))
+
+    def _store(self, group, raw, fetched=None, stale=False):
+        """Swaps in a snapshot of a data group built from its raw data,
+        fetched now unless a fetch time is given"""
+        snapshot = self.GROUP_MODELS[group](raw)
+        # A single attribute assignment, readers see either the old or
+        # the new snapshot but never a half updated one
+        setattr(self, "_" + group, snapshot)
+        self._raw[group] = raw
+        self._fetched[group] = time.time() if fetched is None else fetched
+        if stale:
+            self._restored.add(group)
+        else:
+            self._restored.discard(group)
+        self._versions[group] = self._versions.get(group, 0) + 1
+        for listener in self._listeners:
+            try:
+                listener(group, snapshot)
+            # pylint: disable=broad-except
+            except Exception as err:
+                self._debuglog("Listener %r failed: %r", listener, err)
+            # pylint: enable=broad-except
+        return snapshot
+
+    def restore(self, group, raw, fetched):
+        """Serves raw data saved by an earlier run until the first fetch,
+        ignored once live data is in"""
+        if group not in self.GROUPS:
+            raise ValueError("Unknown data group: %s" % group)
+        if self.version(group) > 0:
+            return None
+        return self._store(group, raw, fetched, stale=True)
+
+    def stale(self, group):
+        """Whether the snapshot of a data group was restored, not fetched"""
+        return group in self._restored
 
-            json_response['smart'] = \
-                self._post_url(self._construct_packet(
-                    "Smart", "enumerateDevices"))["response"]
+    def raw(self, group):
+        """The raw rpc.php data behind the snapshot of a data group"""
+        return self._raw.get(group)
 
-            json_response['raid'] = \
-                self._post_url(self._construct_packet(
-                    "RaidMgmt", "enumerateDevices"))["response"]
+    def add_listener(self, listener):
+        """Registers a callable(group, snapshot) run after every refresh"""
+        self._listeners.append(listener)
 
-            json_response['disk'] = \
-                self._post_url(self._construct_packet(
-                    "DiskMgmt", "enumerateDevices"))["response"]
+    def version(self, group):
+        """Number of snapshots fetched so far for a data group"""
+        return self._versions.get(group, 0)
 
-            self._storage.update(json_response)
-        if self._health is not None:
-            packet = self._construct_packet("Health", "getHealthInfo")
-            self._health.update(self._post_url(packet)["response"])
+    def current(self, group):
+        """The snapshot of a data group with its version, without fetching"""
+        return getattr(self, "_" + group), self.version(group)
 
-        if self._service is not None:
-            packet = self._construct_packet("service", "getStatus")
-            self._service.update(self._post_url(packet)["response"])
+    def fetched_at(self, group):
+        """Unix time of the last successful fetch of a data group"""
+        return self._fetched.get(group)
 
+    def data_age(self, group):
+        """Age in seconds of a data group, None if never fetched"""
+        fetched = self.fetched_at(group)
+        if fetched is not None:
+            return time.time() - fetched
+
+    def update(self):
+        """Updates the various instanced modules"""
+        for group in self.GROUPS:
+            if getattr(self, "_" + group) is not None:
+                self.refresh(group)
 
     @property
     def utilisation(self):
         """Getter for various Utilisation variables"""
         if self._utilisation is None:
-            packet = self._construct_packet("System", "getInformation")
-            self._utilisation = OmvUtilization(
-                self._post_url(packet)["response"])
+            self.refresh("utilisation")
         return self._utilisation
 
     @property
     def storage(self):
         """Getter for various Storage variables"""
         if self._storage is None:
-            json_response = {}
-            json_response['volumes'] = \
-                self._post_url(self._construct_packet(
-                    "FileSystemMgmt", "enumerateFilesystems"))["response"]
-
-            json_response['smart'] = \
-                self._post_url(self._construct_packet(
-                    "Smart", "enumerateDevices"))["response"]
-
-            json_response['raid'] = \
-                self._post_url(self._construct_packet(
-                    "RaidMgmt", "enumerateDevices"))["response"]
-
-            json_response['disk'] = \
-                self._post_url(self._construct_packet(
-                    "DiskMgmt", "enumerateDevices"))["response"]
-
-            self._storage = OmvStorage(json_response)
+            self.refresh("storage")
         return self._storage
 
     @property
     def health(self):
         """Getter for various Storage variables"""
         if self._health is None:
-            packet = self._construct_packet("Health", "getHealthInfo")
-            self._health = OmvHealth(self._post_url(packet)["response"])
+            self.refresh("health")
         return self._health
 
     @property
     def services(self):
         """Getter for various services variables"""
         if self._services is None:
-            packet = self._construct_packet("services", "getStatus")
-            self._services = OmvServices(self._post_url(packet)["response"])
+            self.refresh("services")
         return self._services
@@ -0,0 +1,114 @@
+"""Client side limits keeping the load on the NAS bounded"""
+# -*- coding:utf-8 -*-
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """The NAS failed too often, calls are refused until it may recover"""
+
+
+class TokenBucket(object):
+    """Allows rate calls per second on average and bursts of up to burst"""
+    def __init__(self, rate, burst):
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Takes a token, returns the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens +
+                               (now - self._updated) * self._rate)
+            self._updated = now
+            # Going negative queues the callers behind each other
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._rate
+
+
+class CircuitBreaker(object):
+    """Opens after failures in a row, lets one probe through once
+    reset_timeout passed and closes again when it succeeds"""
+    def __init__(self, failures=5, reset_timeout=30):
+        self._max_failures = failures
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self):
+        """Whether calls are currently refused"""
+        return self._opened is not None
+
+    def allow(self):
+        """Whether a call may go to the NAS now"""
+        with self._lock:
+            if self._opened is None:
+                return True
+            if self._probing or \
+               time.monotonic() - self._opened < self._reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        """Records a successful call, closing the breaker"""
+        with self._lock:
+            self._failures = 0
+            self._opened = None
+            self._probing = False
+
+    def failure(self):
+        """Records a failed call, returns True if that opened the breaker"""
+        with self._lock:
+            self._failures += 1
+            if self._probing:
+                # The probe failed, stay open for another reset_timeout
+                self._probing = False
+                self._opened = time.monotonic()
+                return False
+            if self._opened is None and self._failures >= self._max_failures:
+                self._opened = time.monotonic()
+                return True
+            return False
+
+
+class RpcThrottle(object):
+    """Token bucket per rpc method, jittered exponential backoff between
+    attempts and a circuit breaker for the whole NAS"""
+    # pylint: disable=too-many-arguments
+    def __init__(self, rate=2.0, burst=4, failures=5, reset_timeout=30,
+                 backoff_base=0.5, backoff_cap=10.0):
+        self._rate = rate
+        self._burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.breaker = CircuitBreaker(failures, reset_timeout)
+        self._backoff_base = backoff_base
+        self._backoff_cap = backoff_cap
+    # pylint: enable=too-many-arguments
+
+    def reserve(self, rpc):
+        """Seconds to wait before calling rpc, 0 if rate limiting is off"""
+        if not self._rate:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(rpc)
+            if bucket is None:
+                bucket = self._buckets[rpc] = TokenBucket(self._rate,
+                                                          self._burst)
+        return bucket.reserve()
+
+    def backoff(self, attempt):
+        """Seconds to wait after the given failed attempt, full jitter"""
+        ceiling = min(self._backoff_cap,
+                      self._backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
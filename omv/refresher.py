@@ -0,0 +1,88 @@
+"""Background refreshers keeping the Openmediavault snapshots up to date"""
+# -*- coding:utf-8 -*-
+import asyncio
+import time
+
+
+class _RefreshSchedule(object):
+    """TTL bookkeeping of a refresher"""
+    def __init__(self, api, ttls):
+        self._api = api
+        self._ttls = dict(ttls)
+        self._next_run = {}
+
+        for group in self._ttls:
+            if group not in api.GROUPS:
+                raise ValueError("Unknown data group: %s" % group)
+
+    def _due_groups(self):
+        """Returns the groups whose TTL expired and schedules their next run"""
+        now = time.monotonic()
+        due = []
+        for group, ttl in self._ttls.items():
+            if self._next_run.get(group, 0) <= now:
+                # Schedule before fetching so a failing NAS is retried on
+                # the group TTL instead of in a tight loop
+                self._next_run[group] = now + ttl
+                due.append(group)
+        return due
+
+    def _seconds_to_next_run(self):
+        """Seconds until the next group is due"""
+        wait = min(self._next_run.values()) - time.monotonic()
+        return max(wait, 0.1)
+
+    def _refresh_failed(self, group, err):
+        """Logs a failed refresh, the previous snapshot stays in place"""
+        self._api._debuglog("Refresh of %s failed: %r", group, err)
+
+
+class AsyncOmvRefresher(_RefreshSchedule):
+    """Re-polls each data group of an AsyncOpenmediavault on its own TTL"""
+    def __init__(self, api, ttls):
+        super().__init__(api, ttls)
+        self._task = None
+        self._semaphore = None
+
+    def start(self, semaphore=None):
+        """Starts the refresher task on the running loop, a semaphore
+        shared by several refreshers bounds their concurrent fetches"""
+        if self._task is not None and not self._task.done():
+            return
+        self._semaphore = semaphore
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stops the refresher task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh(self, group):
+        """Refreshes one group"""
+        if self._semaphore is not None:
+            async with self._semaphore:
+                return await self._refresh_now(group)
+        return await self._refresh_now(group)
+
+    async def _refresh_now(self, group):
+        """Refreshes one group right away"""
+        try:
+            await self._api.arefresh(group)
+        # pylint: disable=broad-except
+        except Exception as err:
+            self._refresh_failed(group, err)
+        # pylint: enable=broad-except
+
+    async def _run(self):
+        """Refresher task main loop"""
+        while True:
+            # A slow group (SMART on a big chassis) must not hold up others
+            await asyncio.gather(*[
+                self._refresh(group) for group in self._due_groups()
+            ])
+            await asyncio.sleep(self._seconds_to_next_run())
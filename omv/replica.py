@@ -0,0 +1,28 @@
+"""Client whose snapshots are fetched by another process"""
+# -*- coding:utf-8 -*-
+import asyncio
+
+from omv.aio import AsyncOpenmediavault
+
+
+class ReplicaOpenmediavault(AsyncOpenmediavault):
+    """AsyncOpenmediavault of a worker process, it never calls the NAS and
+    receives the snapshots the poller process fetched instead"""
+    def __init__(self, debugmode=False):
+        super().__init__(None, None, None, None, debugmode=debugmode)
+        self._arrivals = {}
+
+    def replicate(self, group, raw, fetched, stale=False):
+        """Swaps in a snapshot published by the poller"""
+        snapshot = self._store(group, raw, fetched, stale)
+        arrival = self._arrivals.pop(group, None)
+        if arrival is not None:
+            arrival.set()
+        return snapshot
+
+    async def _arefresh(self, group):
+        """Waits for the next snapshot the poller publishes"""
+        # Created here so it belongs to the running loop
+        arrival = self._arrivals.setdefault(group, asyncio.Event())
+        await arrival.wait()
+        return getattr(self, "_" + group)
@@ -0,0 +1,70 @@
+"""Latency and error counters of the rpc.php calls"""
+# -*- coding:utf-8 -*-
+import bisect
+import collections
+
+
+class LatencyHistogram(object):
+    """Counts of durations per fixed bucket, constant memory"""
+    # Upper bounds in seconds, anything slower lands in the last bucket
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        """Adds a duration"""
+        self._counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self):
+        """Count, sum, max and cumulative bucket counts"""
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS + ("+Inf",), self._counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class RpcStats(object):
+    """Per service.method latencies and failures, login and session events"""
+    def __init__(self):
+        self._latency = collections.defaultdict(LatencyHistogram)
+        self._failures = collections.Counter()
+        self._error_codes = collections.Counter()
+        self._events = collections.Counter()
+
+    def observe(self, rpc, seconds, failed=False):
+        """Records one rpc.php call"""
+        self._latency[rpc].observe(seconds)
+        if failed:
+            self._failures[rpc] += 1
+
+    def error_code(self, code):
+        """Records an error code returned by rpc.php"""
+        self._error_codes[str(code)] += 1
+
+    def event(self, name):
+        """Counts a session event such as a login"""
+        self._events[name] += 1
+
+    def summary(self):
+        """All counters as plain data"""
+        return {
+            "calls": {rpc: dict(histogram.summary(),
+                                failures=self._failures[rpc])
+                      for rpc, histogram in self._latency.items()},
+            "error_codes": dict(self._error_codes),
+            "events": dict(self._events),
+        }
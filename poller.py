@@ -0,0 +1,52 @@
+"""Poller process of a multi-worker deployment
+
+Owns the OpenMediaVault clients and publishes every snapshot to
+OPENMEDIAVAULT_SHARED_DIR, where any number of uvicorn workers started with
+the same variable pick them up:
+
+    python -m poller &
+    uvicorn main:app --workers 4
+"""
+# -*- coding:utf-8 -*-
+import asyncio
+import signal
+
+from settings import omvhosts, omvsessiontimeout, omvfleetconcurrency, \
+    omvcoldtimeout, refresh_ttls, omvhistorysamples, omvsnapshotfile, \
+    omvthrottle, omvshareddir, omvchangedepth, omvalertrules, \
+    omvalertwebhook, omvalertfile, omvsmart
+from alerts import AlertEngine, configured_sinks, load_rules
+from fleet import Fleet
+
+
+async def poll():
+    """Polls every host until SIGTERM or SIGINT"""
+    fleet = Fleet(omvhosts, refresh_ttls, omvsessiontimeout,
+                  omvfleetconcurrency, omvcoldtimeout, omvhistorysamples,
+                  omvsnapshotfile, omvthrottle, change_depth=omvchangedepth,
+                  alerts=AlertEngine(load_rules(omvalertrules),
+                                     configured_sinks(omvalertwebhook,
+                                                      omvalertfile)),
+                  smart=omvsmart)
+    shared = fleet.publish(omvshareddir)
+    stopped = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    fleet.start()
+    try:
+        await stopped.wait()
+    finally:
+        await fleet.stop()
+        shared.close()
+
+
+def main():
+    """Runs the poller"""
+    if not omvshareddir:
+        raise SystemExit("OPENMEDIAVAULT_SHARED_DIR is not set")
+    asyncio.run(poll())
+
+
+if __name__ == "__main__":
+    main()
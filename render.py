@@ -0,0 +1,259 @@
+"""Builds the response payloads of the api endpoints from the snapshots"""
+# -*- coding:utf-8 -*-
+import metrics
+from omv.omv import FormatHelper
+from selection import Selection
+
+
+def host(utilisation):
+    """Payload of /host, formatted from the values as OMV sent them"""
+    detailed = utilisation.detailed_host or {}
+    load = utilisation.load_average or {}
+    return {
+        "hostname": str(detailed.get("hostname")),
+        "version": str(detailed.get("version")),
+        "processor": str(detailed.get("processor")),
+        "kernel": str(detailed.get("kernel")),
+        "uptime": str(detailed.get("uptime")),
+        "cpu_load": str(detailed.get("cpuUsage")) + "%",
+        "cpu_load_1min": str(load.get("1min")) + "%",
+        "cpu_load_5min": str(load.get("5min")) + "%",
+        "cpu_load_15min": str(load.get("15min")) + "%",
+        "memory_total": str(detailed.get("memTotal")) + " KB",
+        "memory_free": str(detailed.get("memFree")) + " KB",
+        "memory_used": str(detailed.get("memUsed")) + " KB",
+        "config_dirty": str(detailed.get("configDirty")),
+        "rebootRequired": str(detailed.get("rebootRequired")),
+        "pkgUpdatesAvailable": str(detailed.get("pkgUpdatesAvailable"))
+    }
+
+
+def _readable(num):
+    """Bytes as shown by /volumes"""
+    if num is None:
+        return str(None)
+    return FormatHelper.bytes_to_readable(num)
+
+
+def _percent(value):
+    """Percentage as shown by /volumes"""
+    return str(value) + "%"
+
+
+# Field -> (value accessor filtered on, formatter of the shown value)
+VOLUME_FIELDS = {
+    "id": (lambda storage, vol: vol, str),
+    "status": (lambda storage, vol: storage.volume_status(vol), str),
+    "device_type": (
+        lambda storage, vol: storage.volume_device_type(vol), str),
+    "mounted": (lambda storage, vol: storage.volume_mounted(vol), str),
+    "size_total": (
+        lambda storage, vol: storage.volume_size_total(
+            vol, human_readable=False), _readable),
+    "size_used": (
+        lambda storage, vol: storage.volume_size_used(
+            vol, human_readable=False), _readable),
+    "size_used_p": (
+        lambda storage, vol: storage.volume_percentage_used(vol), _percent),
+    "temp_avg": (
+        lambda storage, vol: storage.volume_disk_temp_avg(vol), str),
+    "temp_max": (
+        lambda storage, vol: storage.volume_disk_temp_max(vol), str),
+}
+
+DISK_FIELDS = {
+    "id": (lambda storage, disk: disk, str),
+    "name": (lambda storage, disk: storage.disk_name(disk), str),
+    "smart_status": (
+        lambda storage, disk: storage.disk_smart_status(disk), str),
+    "temp": (lambda storage, disk: storage.disk_temp(disk), str),
+}
+
+RAID_FIELDS = {
+    "id": (lambda storage, raid: raid, str),
+    "raid_name": (lambda storage, raid: storage.raid_name(raid), str),
+    "raid_state": (lambda storage, raid: storage.raid_state(raid), str),
+    "raid_devices": (
+        lambda storage, raid: storage.raid_devices(raid), str),
+}
+
+
+def _row(storage, key, fields, selection=None):
+    """Entry of one volume, disk or raid, None if filtered out. Only the
+    accessors of the selected and filtered fields are called."""
+    values = {}
+
+    def value(field):
+        if field not in values:
+            values[field] = fields[field][0](storage, key)
+        return values[field]
+
+    if selection is None:
+        columns = list(fields)
+    else:
+        if not selection.matches(value):
+            return None
+        columns = selection.columns(fields)
+    return {field: fields[field][1](value(field)) for field in columns}
+
+
+def _rows(storage, keys, fields, selection=None):
+    """Entries of every volume, disk or raid passing the filters"""
+    rows = [_row(storage, key, fields, selection) for key in keys]
+    return [row for row in rows if row is not None]
+
+
+def _scoped(lists, selection):
+    """Selection per list of raw rpc.php items, each filter only applies
+    to the lists whose items carry its key. Raises ValueError for keys no
+    item carries, they would silently filter everything out."""
+    keys = {name: set(key for item in items for key in item)
+            for name, items in lists.items()}
+    unknown = [key for key, _, _ in selection.filters
+               if not any(key in carried for carried in keys.values())]
+    if unknown:
+        raise ValueError("Unknown fields: %s" % ",".join(unknown))
+    return {name: Selection(selection.fields,
+                            [term for term in selection.filters
+                             if term[0] in keys[name]])
+            for name in lists}
+
+
+def _items(items, selection=None):
+    """Raw rpc.php items passing the filters, with the selected keys"""
+    if selection is None:
+        return items
+    found = []
+    for item in items:
+        if selection.matches(item.get):
+            found.append({key: item[key] for key in selection.columns(item)})
+    return found
+
+
+def volume(storage, devicefile):
+    """Entry of a single volume in /volumes"""
+    return _row(storage, devicefile, VOLUME_FIELDS)
+
+
+def volumes(storage, selection=None):
+    """Payload of /volumes"""
+    return _rows(storage, storage.volumes, VOLUME_FIELDS, selection)
+
+
+def disks(storage, selection=None):
+    """Payload of /disks"""
+    return _rows(storage, storage.disks, DISK_FIELDS, selection)
+
+
+def raids(storage, selection=None):
+    """Payload of /raids"""
+    return _rows(storage, storage.raids, RAID_FIELDS, selection)
+
+
+def fans(health):
+    """Payload of /fans"""
+    fan_data = []
+    for fan in health.fan:
+        fa = {}
+        fa['id'] = str(fan)
+        fa['fan_speed'] = str(health.sent_value(fan))
+        fan_data.append(fa)
+    return fan_data
+
+
+def temps(health):
+    """Payload of /temps"""
+    temp_data = []
+    for temp in health.temp:
+        tem = {}
+        tem['id'] = str(temp)
+        tem['temperature'] = str(health.sent_value(temp))
+        temp_data.append(tem)
+    return temp_data
+
+
+def detailed_storage(storage, selection=None):
+    """Payload of /detailed_storage, filters apply to the items of the
+    rpc.php calls returning their key"""
+    if selection is None:
+        return storage.detailed_storage
+    lists = {key: items or []
+             for key, items in storage.detailed_storage.items()}
+    scoped = _scoped(lists, selection)
+    return {key: _items(items, scoped[key]) for key, items in lists.items()}
+
+
+def detailed_host(utilisation):
+    """Payload of /detailed_host"""
+    return utilisation.detailed_host
+
+
+def services(services, selection=None):
+    """Payload of /services"""
+    service_list = services.service
+    if selection is None:
+        return service_list
+    if isinstance(service_list, dict):
+        items = service_list.get("data", [])
+        scoped = _scoped({"data": items}, selection)["data"]
+        return dict(service_list, data=_items(items, scoped))
+    return _items(service_list,
+                  _scoped({"services": service_list}, selection)["services"])
+
+
+# Endpoint name -> (data groups it is built from, payload builder)
+ENDPOINTS = {
+    "host": (("utilisation",), host),
+    "volumes": (("storage",), volumes),
+    "disks": (("storage",), disks),
+    "raids": (("storage",), raids),
+    "fans": (("health",), fans),
+    "temps": (("health",), temps),
+    "detailed_storage": (("storage",), detailed_storage),
+    "detailed_host": (("utilisation",), detailed_host),
+    "services": (("services",), services),
+}
+
+def batch(endpoints):
+    """Data groups and builder of a payload holding several endpoints,
+    every section is built from the same snapshots"""
+    groups = []
+    for endpoint in endpoints:
+        for group in ENDPOINTS[endpoint][0]:
+            if group not in groups:
+                groups.append(group)
+
+    def build(*snapshots):
+        by_group = dict(zip(groups, snapshots))
+        sections = {}
+        for endpoint in endpoints:
+            endpoint_groups, builder = ENDPOINTS[endpoint]
+            sections[endpoint] = builder(
+                *[by_group[group] for group in endpoint_groups])
+        return sections
+    return tuple(groups), build
+
+
+# Endpoint name -> fields it can select and filter on, None for raw items
+SELECTABLE = {
+    "volumes": VOLUME_FIELDS,
+    "disks": DISK_FIELDS,
+    "raids": RAID_FIELDS,
+    "detailed_storage": None,
+    "services": None,
+}
+
+
+def check_selection(endpoint, selection):
+    """Raises ValueError if an endpoint cannot apply a selection"""
+    if endpoint not in SELECTABLE:
+        raise ValueError("%s takes no fields or filters" % endpoint)
+    if SELECTABLE[endpoint] is not None:
+        selection.check(SELECTABLE[endpoint])
+
+
+# Endpoint name -> (data groups, text body builder, media type)
+TEXT_ENDPOINTS = {
+    "metrics": (("utilisation", "storage", "health", "services"),
+                metrics.exposition, metrics.CONTENT_TYPE),
+}
@@ -0,0 +1,53 @@
+"""Handler latency of every route"""
+# -*- coding:utf-8 -*-
+import collections
+import time
+
+from omv.stats import LatencyHistogram
+
+
+class RouteTimer(object):
+    """ASGI middleware timing each http request until its response starts,
+    streams are timed up to their headers"""
+    def __init__(self, app, stats):
+        self.app = app
+        self._stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.monotonic()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                self._stats.observe(scope, time.monotonic() - started)
+            await send(message)
+        await self.app(scope, receive, timed_send)
+
+
+class RouteStats(object):
+    """Latency histogram per route path"""
+    def __init__(self, app):
+        self._app = app
+        self._paths = None
+        self._latency = collections.defaultdict(LatencyHistogram)
+
+    def _path(self, scope):
+        """Path template of the route that handled a request"""
+        if self._paths is None:
+            # Routes are all registered once requests come in
+            self._paths = {route.endpoint: route.path
+                           for route in self._app.routes
+                           if hasattr(route, "endpoint")}
+        # The router stores the matched endpoint in the scope
+        return self._paths.get(scope.get("endpoint"), "unmatched")
+
+    def observe(self, scope, seconds):
+        """Records the latency of a request"""
+        self._latency[self._path(scope)].observe(seconds)
+
+    def summary(self):
+        """Histogram of every route"""
+        return {path: histogram.summary()
+                for path, histogram in self._latency.items()}
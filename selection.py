@@ -0,0 +1,89 @@
+"""Field projection and row filters given in the query string"""
+# -*- coding:utf-8 -*-
+import operator
+import re
+from urllib.parse import unquote_plus
+
+# Longest operators first so ">=" is not read as ">"
+_TERM = re.compile(r"^([A-Za-z0-9_]+)(!=|>=|<=|=|>|<|~)(.*)$")
+_ORDERINGS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+def _number(value):
+    """A value as float, None if it is not numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Selection(object):
+    """Fields to return and filters every row has to pass"""
+    def __init__(self, fields=None, filters=()):
+        self.fields = fields
+        self.filters = tuple(filters)
+
+    @classmethod
+    def from_query(cls, query):
+        """Parses 'fields=a,b&key=value&key!=value&key>number&key~part...',
+        None if the query selects nothing. Raises ValueError on malformed
+        terms."""
+        fields = None
+        filters = []
+        for term in query.split("&"):
+            term = unquote_plus(term)
+            if not term:
+                continue
+            match = _TERM.match(term)
+            if match is None:
+                raise ValueError("Malformed filter: %s" % term)
+            key, op, value = match.groups()
+            if key == "fields" and op == "=":
+                fields = tuple(name.strip() for name in value.split(",")
+                               if name.strip())
+                continue
+            if op in _ORDERINGS and _number(value) is None:
+                raise ValueError("Not a number: %s" % term)
+            filters.append((key, op, value))
+        if fields is None and not filters:
+            return None
+        return cls(fields, filters)
+
+    def check(self, available):
+        """Raises ValueError for fields or filters not in available"""
+        unknown = [name for name in (self.fields or ())
+                   if name not in available]
+        unknown += [key for key, _, _ in self.filters
+                    if key not in available]
+        if unknown:
+            raise ValueError("Unknown fields: %s" % ",".join(unknown))
+
+    def columns(self, available):
+        """Fields to return out of the available ones, in request order"""
+        if self.fields is None:
+            return list(available)
+        return [name for name in self.fields if name in available]
+
+    def matches(self, value):
+        """Whether a row passes every filter, value(key) reads its fields"""
+        for key, op, expected in self.filters:
+            actual = value(key)
+            if op in _ORDERINGS:
+                actual = _number(actual)
+                if actual is None or \
+                   not _ORDERINGS[op](actual, float(expected)):
+                    return False
+            elif op == "~":
+                if expected.lower() not in str(actual).lower():
+                    return False
+            else:
+                # Case-insensitive so true matches True and good GOOD
+                equal = str(actual).lower() == expected.lower()
+                if equal != (op == "="):
+                    return False
+        return True
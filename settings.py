@@ -1,9 +1,99 @@
 import os
+import yaml
 #############################
 ## OPENMEDIAVAULT SETTINGS ##
 #############################
 
-omvuser = os.environ['OPENMEDIAVAULT_USER']
-omvpasswd = os.environ['OPENMEDIAVAULT_PASSWD']
-omvhost = os.environ['OPENMEDIAVAULT_HOST']
-omvport = os.environ['OPENMEDIAVAULT_PORT']
+# Seconds an idle OMV session stays valid (OMV webadmin timeout)
+omvsessiontimeout = float(os.environ.get('OPENMEDIAVAULT_SESSION_TIMEOUT', 300))
+
+# YAML file listing several OpenMediaVault hosts, see readme
+omvfleetfile = os.environ.get('OPENMEDIAVAULT_FLEET')
+# Max number of hosts polled at the same time
+omvfleetconcurrency = int(os.environ.get('OPENMEDIAVAULT_FLEET_CONCURRENCY', 4))
+
+# SQLite file keeping the last good data across restarts, unset disables it
+omvsnapshotfile = os.environ.get('OPENMEDIAVAULT_SNAPSHOT_FILE')
+
+# Directory the poller process publishes snapshots to for the api workers,
+# unset runs a single process polling by itself
+omvshareddir = os.environ.get('OPENMEDIAVAULT_SHARED_DIR')
+
+# Seconds a request waits for data that was never fetched before 503
+omvcoldtimeout = float(os.environ.get('OPENMEDIAVAULT_COLD_TIMEOUT', 10))
+
+if omvfleetfile:
+    with open(omvfleetfile) as fleet:
+        omvhosts = yaml.safe_load(fleet)['hosts']
+else:
+    # Missing variables leave the api running but never ready
+    omvuser = os.environ.get('OPENMEDIAVAULT_USER')
+    omvpasswd = os.environ.get('OPENMEDIAVAULT_PASSWD')
+    omvhost = os.environ.get('OPENMEDIAVAULT_HOST')
+    omvport = os.environ.get('OPENMEDIAVAULT_PORT', 443)
+    omvhosts = {}
+    if omvhost and omvuser and omvpasswd is not None:
+        omvhosts["default"] = {
+            "host": omvhost,
+            "port": omvport,
+            "user": omvuser,
+            "password": omvpasswd,
+        }
+
+#############################
+##   UPSTREAM PROTECTION   ##
+#############################
+
+# Limits on the calls made to each OpenMediaVault host
+omvthrottle = {
+    # rpc.php calls per second and burst size, per rpc method
+    "rate": float(os.environ.get('OPENMEDIAVAULT_RPC_RATE', 2)),
+    "burst": int(os.environ.get('OPENMEDIAVAULT_RPC_BURST', 4)),
+    # Failures in a row that stop all calls for the reset timeout
+    "failures": int(os.environ.get('OPENMEDIAVAULT_BREAKER_FAILURES', 5)),
+    "reset_timeout": float(os.environ.get('OPENMEDIAVAULT_BREAKER_RESET', 30)),
+}
+
+#############################
+##   REFRESHER SETTINGS    ##
+#############################
+
+# Seconds between background re-polls of each data group
+refresh_ttls = {
+    "utilisation": float(os.environ.get('OPENMEDIAVAULT_TTL_UTILISATION', 5)),
+    "storage": float(os.environ.get('OPENMEDIAVAULT_TTL_STORAGE', 60)),
+    "health": float(os.environ.get('OPENMEDIAVAULT_TTL_HEALTH', 10)),
+    "services": float(os.environ.get('OPENMEDIAVAULT_TTL_SERVICES', 30)),
+}
+
+#############################
+##     SMART SETTINGS      ##
+#############################
+
+# Detailed S.M.A.R.T. attributes are fetched for a few disks every interval
+# seconds, 0 disables collecting them
+omvsmart = {
+    "per_tick": int(os.environ.get('OPENMEDIAVAULT_SMART_DISKS', 2)),
+    "interval": float(os.environ.get('OPENMEDIAVAULT_SMART_INTERVAL', 60)),
+}
+
+#############################
+##    HISTORY SETTINGS     ##
+#############################
+
+# Raw samples kept per metric, older ones survive as 1min and 1hour averages
+omvhistorysamples = int(os.environ.get('OPENMEDIAVAULT_HISTORY_SAMPLES', 720))
+# Generations of storage, health and services changes kept for /changes,
+# clients further behind get a full snapshot
+omvchangedepth = int(os.environ.get('OPENMEDIAVAULT_CHANGE_HISTORY', 64))
+
+#############################
+##     ALERT SETTINGS      ##
+#############################
+
+# YAML file with alert rules, see readme, unset uses the built-in rules
+omvalertrules = os.environ.get('OPENMEDIAVAULT_ALERT_RULES')
+# Url alert transitions are POSTed to, unset disables it
+omvalertwebhook = os.environ.get('OPENMEDIAVAULT_ALERT_WEBHOOK')
+# File alert transitions are appended to as JSON lines, unset disables it
+omvalertfile = os.environ.get('OPENMEDIAVAULT_ALERT_FILE')
@@ -0,0 +1,169 @@
+"""Snapshots published by one poller process to any number of workers"""
+# -*- coding:utf-8 -*-
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+# One unsigned 64 bit version per host and data group
+_SLOT = struct.Struct("<Q")
+
+
+class SharedSnapshots(object):
+    """Directory holding the raw data of every host and data group, one
+    file each, plus a memory-mapped index of their versions.
+
+    The poller writes a payload file, atomically replaces the old one and
+    then bumps its version. Workers compare the versions in the mapped
+    index and only read and parse a payload when its version moved.
+    """
+    def __init__(self, directory):
+        self._directory = directory
+        self._slots = {}
+        self._index = None
+        self._index_size = 0
+        self._index_inode = None
+        self._layout = None
+        self._seen = {}
+
+    def _path(self, name):
+        """Path of a file in the shared directory"""
+        return os.path.join(self._directory, name)
+
+    def _map(self, writable, reset=False):
+        """Maps the index file, reset replaces it by one with all versions
+        at zero"""
+        if self._index is not None:
+            self._index.close()
+        if reset:
+            # A new file rather than truncating, workers may still read
+            # the old one through their mapping
+            with open(self._path("index.tmp"), "wb") as index_file:
+                index_file.write(bytes(self._index_size))
+            os.replace(self._path("index.tmp"), self._path("index"))
+        mode = os.O_RDWR | os.O_CREAT if writable else os.O_RDONLY
+        handle = os.open(self._path("index"), mode)
+        try:
+            if writable and os.fstat(handle).st_size != self._index_size:
+                os.ftruncate(handle, self._index_size)
+            self._index = mmap.mmap(
+                handle, self._index_size,
+                access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        finally:
+            os.close(handle)
+
+    def create(self, hosts, groups):
+        """Prepares the directory for publishing, called by the poller"""
+        os.makedirs(self._directory, exist_ok=True)
+        layout = [[host, group] for host in hosts for group in groups]
+        self._slots = {tuple(slot): index for index, slot in enumerate(layout)}
+        self._index_size = max(1, len(layout)) * _SLOT.size
+        try:
+            with open(self._path("layout.json")) as layout_file:
+                same_layout = json.load(layout_file) == layout
+        except (OSError, ValueError):
+            same_layout = False
+        # Versions keep counting across poller restarts as long as the
+        # hosts stay the same. Otherwise a slot could carry the version of
+        # another host, so they start over, before workers see the layout.
+        self._map(writable=True, reset=not same_layout)
+        if same_layout:
+            return
+        with open(self._path("layout.json.tmp"), "w") as layout_file:
+            json.dump(layout, layout_file)
+        os.replace(self._path("layout.json.tmp"), self._path("layout.json"))
+
+    def publish(self, host, group, fetched, raw, stale=False):
+        """Replaces the data of a host and group, then bumps its version"""
+        slot = self._slots[(host, group)]
+        name = "%s.%s.json" % (host, group)
+        with open(self._path(name + ".tmp"), "w") as payload:
+            json.dump({"fetched": fetched, "stale": stale, "raw": raw},
+                      payload, separators=(",", ":"))
+        os.replace(self._path(name + ".tmp"), self._path(name))
+        offset = slot * _SLOT.size
+        version = _SLOT.unpack_from(self._index, offset)[0]
+        _SLOT.pack_into(self._index, offset, version + 1)
+
+    def attach(self, host, api):
+        """Publishes every snapshot of a host's client"""
+        def publish(group, _):
+            self.publish(host, group, api.fetched_at(group), api.raw(group),
+                         api.stale(group))
+        api.add_listener(publish)
+
+    def _follow(self):
+        """Maps the index written by the poller, again when it was
+        recreated. False while the poller has not published anything."""
+        try:
+            index = os.stat(self._path("index"))
+            layout_changed = os.stat(self._path("layout.json")).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        size = index.st_size
+        if self._index is not None and \
+           (size, index.st_ino, layout_changed) == \
+           (self._index_size, self._index_inode, self._layout):
+            return True
+        # First call or the poller started with other hosts
+        with open(self._path("layout.json")) as layout_file:
+            layout = json.load(layout_file)
+        self._slots = {tuple(slot): index for index, slot in enumerate(layout)}
+        self._index_size = size
+        self._index_inode = index.st_ino
+        self._layout = layout_changed
+        self._seen = {}
+        self._map(writable=False)
+        return True
+
+    def changes(self):
+        """(host, group, fetched, raw, stale) of everything published since
+        the last call, called by the workers"""
+        if not self._follow():
+            return []
+        changed = []
+        for (host, group), slot in self._slots.items():
+            version = _SLOT.unpack_from(self._index, slot * _SLOT.size)[0]
+            if version == 0 or version == self._seen.get((host, group)):
+                continue
+            try:
+                with open(self._path("%s.%s.json" % (host, group))) as \
+                        payload:
+                    data = json.load(payload)
+            except (OSError, ValueError) as err:
+                # Read again on the next call
+                _LOGGER.warning("Cannot read %s.%s: %r", host, group, err)
+                continue
+            self._seen[(host, group)] = version
+            changed.append((host, group, data["fetched"], data["raw"],
+                            data["stale"]))
+        return changed
+
+    async def follow(self, replicate, interval=0.25):
+        """Hands everything published to replicate(host, group, fetched,
+        raw, stale). Errors are logged, one bad payload must not stop the
+        worker from following the others."""
+        while True:
+            # pylint: disable=broad-except
+            try:
+                changed = self.changes()
+            except Exception:
+                _LOGGER.exception("Cannot read the shared snapshots")
+                changed = []
+            for change in changed:
+                try:
+                    replicate(*change)
+                except Exception:
+                    _LOGGER.exception("Cannot replicate %s.%s", *change[:2])
+            # pylint: enable=broad-except
+            await asyncio.sleep(interval)
+
+    def close(self):
+        """Unmaps the index"""
+        if self._index is not None:
+            self._index.close()
+            self._index = None
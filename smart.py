@@ -0,0 +1,150 @@
+"""Detailed S.M.A.R.T. attributes, collected a few disks at a time"""
+# -*- coding:utf-8 -*-
+import asyncio
+import time
+
+from omv.ratelimit import CircuitOpenError
+
+
+def devicefile(disk):
+    """Device file of a disk given as sda, dev/sda or /dev/sda, the ways
+    the {disk:path} routes receive it"""
+    name = disk.lstrip("/")
+    if name.startswith("dev/"):
+        name = name[len("dev/"):]
+    return "/dev/" + name
+
+
+class SmartCollector(object):
+    """Latest Smart.getAttributes of every disk of a host, keyed by device
+    file. Each tick fetches per_tick disks: those whose model or overall
+    status changed since their last collection first, then the ones
+    attempted longest ago, so disks whose fetch keeps failing do not take
+    every tick.
+
+    Disks without a temperature in the storage summary are skipped, OMV
+    reports none for disks in standby and smartctl would spin them up.
+    """
+    def __init__(self, api, per_tick=2, interval=60):
+        self._api = api
+        self._per_tick = per_tick
+        self.interval = interval
+        self._summaries = {}
+        self._asleep = set()
+        # Device files whose summary changed, in the order they did
+        self._changed = []
+        self._index = {}
+        # Device file -> when its attributes were last requested, whether
+        # or not that succeeded
+        self._attempted = {}
+        self._listeners = []
+        self._wakeup = None
+        api.add_listener(self._on_refresh)
+
+    def add_listener(self, callback):
+        """Calls callback() whenever the attributes of a disk changed"""
+        self._listeners.append(callback)
+
+    def _on_refresh(self, group, storage):
+        """Queues disks whose summary changed, forgets vanished disks"""
+        if group != "storage":
+            return
+        summaries = {}
+        asleep = set()
+        for devicefile in storage.disks or ():
+            summaries[devicefile] = (storage.disk_name(devicefile),
+                                     storage.disk_smart_status(devicefile))
+            if storage.disk_temp(devicefile) is None:
+                asleep.add(devicefile)
+            if self._summaries.get(devicefile) != summaries[devicefile] and \
+               devicefile not in self._changed:
+                self._changed.append(devicefile)
+        self._changed = [devicefile for devicefile in self._changed
+                         if devicefile in summaries]
+        vanished = [devicefile for devicefile in self._index
+                    if devicefile not in summaries]
+        for devicefile in vanished:
+            del self._index[devicefile]
+        self._attempted = {devicefile: attempted for devicefile, attempted
+                           in self._attempted.items()
+                           if devicefile in summaries}
+        self._summaries = summaries
+        self._asleep = asleep
+        if vanished:
+            self._notify()
+        if self._wakeup is not None and \
+           any(devicefile not in asleep for devicefile in self._changed):
+            self._wakeup.set()
+
+    def _notify(self):
+        """Calls the listeners"""
+        for callback in self._listeners:
+            callback()
+
+    def due(self):
+        """Device files to collect next, at most per_tick"""
+        awake = [devicefile for devicefile in self._summaries
+                 if devicefile not in self._asleep]
+        changed = [devicefile for devicefile in self._changed
+                   if devicefile not in self._asleep]
+        rest = sorted((devicefile for devicefile in awake
+                       if devicefile not in self._changed),
+                      key=lambda devicefile: self._attempted.get(
+                          devicefile, 0))
+        return (changed + rest)[:self._per_tick]
+
+    async def tick(self):
+        """Collects the attributes of the disks that are due"""
+        collected = False
+        for devicefile in self.due():
+            attempted = time.time()
+            try:
+                attributes = await self._api.aget_smart_attributes(devicefile)
+            except CircuitOpenError:
+                # The NAS is failing, try again next tick
+                break
+            # pylint: disable=broad-except
+            except Exception:
+                attributes = None
+            # pylint: enable=broad-except
+            self._attempted[devicefile] = attempted
+            if devicefile in self._changed:
+                self._changed.remove(devicefile)
+            if attributes is None:
+                continue
+            self._index[devicefile] = {
+                "fetched": time.time(),
+                "attributes": attributes,
+            }
+            collected = True
+        if collected:
+            self._notify()
+
+    async def run(self):
+        """Ticks every interval seconds and whenever a storage refresh
+        queued changed disks, until cancelled"""
+        # Created here so it belongs to the running loop
+        self._wakeup = asyncio.Event()
+        while True:
+            self._wakeup.clear()
+            await self.tick()
+            # Disks whose summary changed are collected without waiting
+            # for the rest of the interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def attributes(self, devicefile):
+        """Latest attributes of a disk with the time they were fetched,
+        None if not collected yet"""
+        return self._index.get(devicefile)
+
+    def raw(self):
+        """The whole index, as published to worker processes"""
+        return self._index
+
+    def replicate(self, index):
+        """Swaps in an index collected by the poller process"""
+        self._index = index
+        self._notify()
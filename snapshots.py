@@ -0,0 +1,118 @@
+"""Last good raw rpc.php data of every host, kept on disk across restarts"""
+# -*- coding:utf-8 -*-
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _connect(path):
+    """Connection to the snapshot file"""
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    # Losing the last write on power loss only costs one poll
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class SnapshotStore(object):
+    """SQLite file holding one compressed raw payload per host and group.
+
+    Saving only queues the payload, a writer thread encodes and writes it
+    so neither the JSON encoding nor an fsync holds up the event loop. A
+    newer snapshot of a group replaces one still waiting to be written.
+    """
+    def __init__(self, path):
+        # Loads run on the event loop thread, writes on the writer's own
+        # connection
+        self._db = _connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            "host TEXT NOT NULL, grp TEXT NOT NULL, fetched REAL NOT NULL, "
+            "payload BLOB NOT NULL, PRIMARY KEY (host, grp))")
+        self._db.commit()
+        # (host, group) -> (fetch time, raw data) not written yet
+        self._pending = {}
+        self._wakeup = threading.Condition()
+        self._closing = False
+        self._writer = threading.Thread(
+            target=self._write_pending, args=(path,),
+            name="omv-snapshots", daemon=True)
+        self._writer.start()
+
+    def save(self, host, group, fetched, raw):
+        """Queues the payload of a data group for the writer thread"""
+        with self._wakeup:
+            self._pending[(host, group)] = (fetched, raw)
+            self._wakeup.notify()
+
+    def _write_pending(self, path):
+        """Writer thread, writes every queued payload in one transaction
+        until closed and drained"""
+        db = _connect(path)
+        try:
+            while True:
+                with self._wakeup:
+                    while not self._pending and not self._closing:
+                        self._wakeup.wait()
+                    if not self._pending:
+                        return
+                    pending, self._pending = self._pending, {}
+                rows = []
+                for (host, group), (fetched, raw) in pending.items():
+                    try:
+                        payload = zlib.compress(json.dumps(
+                            raw, separators=(",", ":")).encode("utf-8"))
+                    except (TypeError, ValueError):
+                        _LOGGER.exception("Cannot encode %s.%s", host, group)
+                        continue
+                    rows.append((host, group, fetched, payload))
+                try:
+                    with db:
+                        db.executemany(
+                            "INSERT OR REPLACE INTO snapshots "
+                            "VALUES (?, ?, ?, ?)", rows)
+                except sqlite3.Error:
+                    # The next refresh of each group queues it again
+                    _LOGGER.exception("Cannot save the snapshots")
+        finally:
+            db.close()
+
+    def load(self, host):
+        """Group -> (fetch time, raw data) stored for a host"""
+        rows = self._db.execute(
+            "SELECT grp, fetched, payload FROM snapshots WHERE host = ?",
+            (host,))
+        return {group: (fetched, json.loads(zlib.decompress(payload)))
+                for group, fetched, payload in rows}
+
+    def attach(self, host, api):
+        """Restores the stored data of a host into its client and saves
+        every snapshot fetched from now on"""
+        for group, (fetched, raw) in self.load(host).items():
+            if group not in api.GROUPS:
+                continue
+            try:
+                api.restore(group, raw, fetched)
+            # pylint: disable=broad-except
+            except Exception as err:
+                # Data saved by an older version may no longer parse
+                api._debuglog("Restoring %s of %s failed: %r",
+                              group, host, err)
+            # pylint: enable=broad-except
+
+        def save_fetched(group, _):
+            if not api.stale(group):
+                self.save(host, group, api.fetched_at(group), api.raw(group))
+        api.add_listener(save_fetched)
+
+    def close(self):
+        """Writes what is still queued and closes the database"""
+        with self._wakeup:
+            self._closing = True
+            self._wakeup.notify()
+        self._writer.join()
+        self._db.close()
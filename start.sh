@@ -0,0 +1,25 @@
+#!/bin/sh
+# Starts the api in the container. One uvicorn process polls by itself
+# unless OPENMEDIAVAULT_WORKERS is above 1, then a poller process feeds
+# that many uvicorn workers through OPENMEDIAVAULT_SHARED_DIR.
+. /opt/venv/bin/activate
+
+WORKERS="${OPENMEDIAVAULT_WORKERS:-1}"
+if [ "$WORKERS" -le 1 ]; then
+    exec uvicorn main:app --reload --host 0.0.0.0 --port 8000
+fi
+
+export OPENMEDIAVAULT_SHARED_DIR="${OPENMEDIAVAULT_SHARED_DIR:-/dev/shm/omv}"
+python -m poller &
+poller=$!
+uvicorn main:app --host 0.0.0.0 --port 8000 --workers "$WORKERS" &
+api=$!
+
+trap 'kill $poller $api; wait; exit 0' TERM INT
+# Stop the container when either process dies so it is restarted
+while kill -0 $poller 2>/dev/null && kill -0 $api 2>/dev/null; do
+    sleep 5
+done
+kill $poller $api 2>/dev/null
+wait
+exit 1
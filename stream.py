@@ -0,0 +1,87 @@
+"""Live feed of host and health metrics for streaming clients"""
+# -*- coding:utf-8 -*-
+import asyncio
+import json
+
+
+class LiveFeed(object):
+    """Fans the changed host and health values of every refresh out to any
+    number of subscribers, one upstream poll feeds all of them.
+
+    Listens on an AsyncOpenmediavault, so publishing happens on its loop.
+    """
+    HOST_FIELDS = ("cpuUsage", "loadAverage", "memTotal", "memFree",
+                   "memUsed")
+
+    def __init__(self, api, queue_size=32):
+        self._queue_size = queue_size
+        self._values = {"utilisation": {}, "health": {}}
+        self._subscribers = set()
+        api.add_listener(self._on_refresh)
+
+    def _extract(self, group, snapshot):
+        """Streamed values of a snapshot"""
+        if group == "utilisation":
+            host = snapshot.detailed_host or {}
+            return {field: host.get(field) for field in self.HOST_FIELDS}
+        return {str(index): snapshot.sent_value(index)
+                for index in snapshot.sensors or {}}
+
+    def _on_refresh(self, group, snapshot):
+        """Publishes the values that changed in a refresh"""
+        if group not in self._values:
+            return
+        old = self._values[group]
+        new = self._extract(group, snapshot)
+        changes = {key: value for key, value in new.items()
+                   if key not in old or old[key] != value}
+        # Vanished sensors are sent as null
+        changes.update({key: None for key in old if key not in new})
+        self._values[group] = new
+        if changes:
+            self._publish({"group": group, "changes": changes})
+
+    def state(self):
+        """Full current values, sent to new and lagging subscribers"""
+        return [{"group": group, "changes": dict(values)}
+                for group, values in self._values.items() if values]
+
+    def _publish(self, message):
+        """Queues a message for every subscriber"""
+        for queue in self._subscribers:
+            if queue.full():
+                # A lagging client would miss deltas, resync it instead
+                while not queue.empty():
+                    queue.get_nowait()
+                for state in self.state():
+                    queue.put_nowait(state)
+            else:
+                queue.put_nowait(message)
+
+    def subscribe(self):
+        """Queue receiving the current state followed by every change"""
+        queue = asyncio.Queue(maxsize=max(self._queue_size,
+                                          len(self._values) + 1))
+        for message in self.state():
+            queue.put_nowait(message)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """Stops sending messages to a queue"""
+        self._subscribers.discard(queue)
+
+    async def events(self, request, keepalive=15):
+        """Server-Sent Events stream until the client disconnects"""
+        queue = self.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield "event: %s\ndata: %s\n\n" % (
+                    message["group"], json.dumps(message["changes"]))
+        finally:
+            self.unsubscribe(queue)
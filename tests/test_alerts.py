@@ -0,0 +1,90 @@
+"""Alert rules evaluated on the refreshes of a host"""
+# -*- coding:utf-8 -*-
+import pytest
+
+from alerts import AlertEngine, Rule, load_rules
+from changes import ChangeFeed
+from omv.replica import ReplicaOpenmediavault
+
+
+def _storage(used, state="clean", status="GOOD", temperature="35°C"):
+    """Storage.* raw data of one raid volume on one disk"""
+    return {
+        "volumes": [{"devicefile": "/dev/md0", "mounted": True,
+                     "size": str(2 * 10 ** 12),
+                     "available": str(2 * 10 ** 12 - used)}],
+        "raid": [{"devicefile": "/dev/md0", "name": "data", "level": "raid1",
+                  "state": state, "devices": ["/dev/sda1"]}],
+        "smart": [{"devicefile": "/dev/sda", "model": "WDC WD40EFRX",
+                   "overallstatus": status, "temperature": temperature}],
+    }
+
+
+def _services(running):
+    return [{"name": "ssh", "title": "SSH", "enabled": True,
+             "running": running}]
+
+
+def _engine():
+    """Engine with the default rules watching one replica host"""
+    api = ReplicaOpenmediavault()
+    engine = AlertEngine(load_rules())
+    engine.watch("nas", ChangeFeed(api))
+    return api, engine
+
+
+def _firing(engine):
+    return sorted((alert["rule"], alert["entity"]) for alert in engine.active)
+
+
+def test_default_rules_fire():
+    api, engine = _engine()
+    api.replicate("storage", _storage(10 ** 12), 1.0)
+    api.replicate("services", _services(True), 1.0)
+    assert _firing(engine) == []
+
+    api.replicate("storage", _storage(19 * 10 ** 11, "clean, degraded",
+                                      "BAD_SECTOR", "55°C"), 2.0)
+    api.replicate("services", _services(False), 2.0)
+    assert _firing(engine) == [
+        ("disk_hot", "/dev/sda"),
+        ("disk_smart", "/dev/sda"),
+        ("raid_degraded", "/dev/md0"),
+        ("service_down", "ssh"),
+        ("volume_full", "/dev/md0"),
+    ]
+    full = [alert for alert in engine.active
+            if alert["rule"] == "volume_full"][0]
+    assert full["values"] == {"size_used_p": 95.0}
+
+
+def test_clear_condition_keeps_firing_until_it_matches():
+    api, engine = _engine()
+    api.replicate("storage", _storage(19 * 10 ** 11), 1.0)
+    assert _firing(engine) == [("volume_full", "/dev/md0")]
+    # 88% is under the threshold but above the clear condition
+    api.replicate("storage", _storage(176 * 10 ** 10), 2.0)
+    assert _firing(engine) == [("volume_full", "/dev/md0")]
+    api.replicate("storage", _storage(16 * 10 ** 11), 3.0)
+    assert _firing(engine) == []
+    assert [alert["state"] for alert in engine.recent] == \
+        ["firing", "resolved"]
+
+
+def test_restored_data_waits_for_the_first_fetch():
+    api, engine = _engine()
+    api.restore("storage", _storage(19 * 10 ** 11), 1.0)
+    assert _firing(engine) == []
+    # Unchanged since the restore, still evaluated once fetched
+    api.replicate("storage", _storage(19 * 10 ** 11), 2.0)
+    assert _firing(engine) == [("volume_full", "/dev/md0")]
+
+
+@pytest.mark.parametrize("endpoint, when", [
+    ("volume", "size_used_p>90"),
+    ("volumes", "used_p>90"),
+    ("temps", "temp>50"),
+])
+def test_rules_with_unknown_endpoints_or_fields_are_rejected(endpoint, when):
+    with pytest.raises(ValueError):
+        Rule("typo", endpoint, when).check()
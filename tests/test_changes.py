@@ -0,0 +1,62 @@
+"""Change feed generations and their replication to worker processes"""
+# -*- coding:utf-8 -*-
+import json
+from types import SimpleNamespace
+
+from changes import ChangeFeed
+
+
+class _Api(object):
+    """Client calling its listeners with the snapshots it is given"""
+    def __init__(self):
+        self._listeners = []
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def stale(self, group):
+        return False
+
+    def refresh(self, *services):
+        snapshot = SimpleNamespace(service=list(services))
+        for callback in self._listeners:
+            callback("services", snapshot)
+
+
+def _service(name, running=True):
+    return {"name": name, "enabled": True, "running": running}
+
+
+def test_generations_keep_the_changed_entries():
+    api = _Api()
+    feed = ChangeFeed(api)
+    api.refresh(_service("ssh"), _service("nfs"))
+    api.refresh(_service("ssh"), _service("nfs"))
+    assert feed.generation == 1
+    api.refresh(_service("ssh", running=False), _service("nfs"))
+    assert feed.generation == 2
+    assert feed.since(1, feed.epoch)["changes"] == [
+        {"op": "replace", "path": "/services/ssh/running", "value": False}]
+    assert feed.since(1, "another")["full"]
+
+
+def test_workers_serve_the_generations_of_the_poller():
+    poller_api = _Api()
+    poller = ChangeFeed(poller_api)
+    published = []
+    poller.add_publisher(
+        lambda: published.append(json.loads(json.dumps(poller.raw()))))
+
+    workers = []
+    for _ in range(2):
+        worker_api = _Api()
+        workers.append((worker_api, ChangeFeed(worker_api, replica=True)))
+
+    poller_api.refresh(_service("ssh"))
+    poller_api.refresh(_service("ssh", running=False))
+    assert len(published) == 2
+    for worker_api, worker in workers:
+        worker_api.refresh(_service("ssh", running=False))
+        worker.replicate(published[-1])
+        assert worker.since(1, poller.epoch) == poller.since(1, poller.epoch)
+        assert worker.since(None) == poller.since(None)
@@ -0,0 +1,185 @@
+"""Circuit breaker and its use by the OpenMediaVault clients"""
+# -*- coding:utf-8 -*-
+import asyncio
+
+import httpx
+import pytest
+
+from omv.aio import AsyncOpenmediavault
+from omv.omv import AuthenticationError, Openmediavault, RpcError
+from omv.ratelimit import CircuitBreaker, RpcThrottle
+
+PACKET = '{"service":"System","method":"getInformation","params":null}'
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failures=3, reset_timeout=30)
+    assert not breaker.failure()
+    breaker.success()
+    assert not breaker.failure()
+    assert not breaker.failure()
+    assert breaker.failure()
+    assert breaker.open
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0)
+    breaker.failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.success()
+    assert not breaker.open
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0)
+    breaker.failure()
+    assert breaker.allow()
+    assert not breaker.failure()
+    assert breaker.open
+    # The next probe may go again once reset_timeout passed
+    assert breaker.allow()
+
+
+class _Nas(object):
+    """rpc.php answering per mode: down (500), html (a proxy error page
+    served with 200), hang (never answers), badlogin (rejects the
+    credentials) or up"""
+    def __init__(self):
+        self.mode = "up"
+
+    async def __call__(self, request):
+        if b'"login"' in request.content and self.mode in ("up", "badlogin"):
+            if self.mode == "badlogin":
+                return httpx.Response(200, json={"response": None, "error": {
+                    "code": 5001,
+                    "message": "Incorrect username or password."}})
+            return httpx.Response(
+                200, json={"response": {"authenticated": True}, "error": None})
+        if self.mode == "down":
+            return httpx.Response(500)
+        if self.mode == "html":
+            return httpx.Response(200, text="<html>Maintenance</html>")
+        if self.mode == "hang":
+            await asyncio.sleep(60)
+        return httpx.Response(200, json={"response": {}, "error": None})
+
+
+def _async_client(nas, throttle):
+    """AsyncOpenmediavault talking to nas"""
+    api = AsyncOpenmediavault("nas", 80, "admin", "secret", throttle=throttle)
+    api._client = httpx.AsyncClient(transport=httpx.MockTransport(nas))
+    return api
+
+
+def test_non_json_probe_does_not_keep_the_breaker_open():
+    nas = _Nas()
+    throttle = RpcThrottle(rate=0, failures=1, reset_timeout=0)
+    api = _async_client(nas, throttle)
+
+    async def scenario():
+        nas.mode = "down"
+        assert await api._aexecute_post_url(PACKET) is None
+        assert throttle.breaker.open
+
+        nas.mode = "html"
+        api._check_circuit()
+        with pytest.raises(ValueError):
+            await api._aexecute_post_url(PACKET)
+
+        nas.mode = "up"
+        api._check_circuit()
+        assert await api._aexecute_post_url(PACKET) is not None
+        assert not throttle.breaker.open
+        await api.aclose()
+
+    asyncio.run(scenario())
+    calls = api.stats.summary()["calls"]
+    assert calls["System.getInformation"]["failures"] == 2
+
+
+def test_cancelled_probe_does_not_keep_the_breaker_open():
+    nas = _Nas()
+    throttle = RpcThrottle(rate=0, failures=1, reset_timeout=0)
+    api = _async_client(nas, throttle)
+
+    async def scenario():
+        nas.mode = "down"
+        await api._aexecute_post_url(PACKET)
+
+        nas.mode = "hang"
+        api._check_circuit()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(api._aexecute_post_url(PACKET), 0.05)
+
+        nas.mode = "up"
+        api._check_circuit()
+        assert await api._aexecute_post_url(PACKET) is not None
+        await api.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_bad_login_raises_without_opening_the_breaker():
+    nas = _Nas()
+    nas.mode = "badlogin"
+    throttle = RpcThrottle(rate=0, failures=1, reset_timeout=30)
+    api = _async_client(nas, throttle)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(AuthenticationError):
+                await api.arefresh("services")
+        assert not throttle.breaker.open
+
+        nas.mode = "up"
+        assert (await api.arefresh("services")) is not None
+        await api.aclose()
+
+    asyncio.run(scenario())
+    assert api.stats.summary()["events"]["login_rejected"] == 3
+
+
+def test_fetch_without_data_raises():
+    nas = _Nas()
+    throttle = RpcThrottle(rate=0, failures=10, reset_timeout=30,
+                           backoff_base=0)
+    api = _async_client(nas, throttle)
+
+    async def scenario():
+        await api._aensure_session()
+        nas.mode = "down"
+        with pytest.raises(RpcError) as raised:
+            await api.arefresh("health")
+        assert not isinstance(raised.value, AuthenticationError)
+        await api.aclose()
+
+    asyncio.run(scenario())
+
+
+class _HtmlSession(object):
+    """requests session whose responses are not JSON"""
+    class Response(object):
+        status_code = 200
+        text = "<html>Maintenance</html>"
+
+        def json(self):
+            raise ValueError("Expecting value")
+
+    def post(self, *args, **kwargs):
+        return self.Response()
+
+
+def test_sync_client_records_non_json_probe():
+    throttle = RpcThrottle(rate=0, failures=1, reset_timeout=0)
+    api = Openmediavault("nas", 80, "admin", "secret", throttle=throttle)
+    api._session = _HtmlSession()
+    throttle.breaker.failure()
+
+    api._check_circuit()
+    with pytest.raises(ValueError):
+        api._execute_post_url(PACKET)
+    # Without the outcome the probe would still be pending and this would raise
+    api._check_circuit()
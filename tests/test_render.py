@@ -0,0 +1,67 @@
+"""Payloads built from the snapshots"""
+# -*- coding:utf-8 -*-
+import json
+
+import render
+from omv.omv import OmvHealth, OmvUtilization
+
+# System.getInformation of OMV 5, numbers partly sent as strings
+INFORMATION = {
+    "hostname": "nas", "version": "5.6.13-1 (Usul)",
+    "cpuModelName": "Intel(R) Celeron(R) J4105",
+    "kernel": "Linux 5.10.0-0.bpo.9-amd64",
+    "time": "Sun 17 Oct 2021 10:00:00 AM CEST",
+    "uptime": "1 day 2 hours 3 minutes 4 seconds",
+    "loadAverage": {"1min": "0.10", "5min": "0.25", "15min": "1.00"},
+    "cpuUsage": 3.0, "memTotal": "16695459840", "memFree": "4064571392",
+    "memUsed": "12630888448", "configDirty": False, "rebootRequired": False,
+    "pkgUpdatesAvailable": True, "dynamic": 1,
+}
+
+# What the release before the typed records served for INFORMATION
+DETAILED_HOST = (
+    '{"hostname": "nas", "version": "5.6.13-1 (Usul)", '
+    '"processor": "Intel(R) Celeron(R) J4105", '
+    '"kernel": "Linux 5.10.0-0.bpo.9-amd64", '
+    '"time": "Sun 17 Oct 2021 10:00:00 AM CEST", '
+    '"uptime": "1 day 2 hours 3 minutes 4 seconds", '
+    '"loadAverage": {"1min": "0.10", "5min": "0.25", "15min": "1.00"}, '
+    '"cpuUsage": 3.0, "memTotal": "16695459840", "memFree": "4064571392", '
+    '"memUsed": "12630888448", "configDirty": false, '
+    '"rebootRequired": false, "pkgUpdatesAvailable": true}')
+HOST = (
+    '{"hostname": "nas", "version": "5.6.13-1 (Usul)", '
+    '"processor": "Intel(R) Celeron(R) J4105", '
+    '"kernel": "Linux 5.10.0-0.bpo.9-amd64", '
+    '"uptime": "1 day 2 hours 3 minutes 4 seconds", "cpu_load": "3.0%", '
+    '"cpu_load_1min": "0.10%", "cpu_load_5min": "0.25%", '
+    '"cpu_load_15min": "1.00%", "memory_total": "16695459840 KB", '
+    '"memory_free": "4064571392 KB", "memory_used": "12630888448 KB", '
+    '"config_dirty": "False", "rebootRequired": "False", '
+    '"pkgUpdatesAvailable": "True"}')
+
+
+def test_host_payloads_keep_the_values_as_sent():
+    utilisation = OmvUtilization(INFORMATION)
+    assert json.dumps(render.detailed_host(utilisation)) == DETAILED_HOST
+    assert json.dumps(render.host(utilisation)) == HOST
+
+
+def test_host_records_are_parsed():
+    utilisation = OmvUtilization(dict(INFORMATION,
+                                      loadAverage="0.10, 0.25, 1.00"))
+    assert utilisation.memTotal == 16695459840
+    assert utilisation.cpu_1min_load == 0.1
+    assert render.host(utilisation)["cpu_load_1min"] == "0.10%"
+
+
+def test_sensor_payloads_keep_the_values_as_sent():
+    health = OmvHealth([
+        {"index": 0, "name": "CPU temperature", "value": "45.000"},
+        {"index": 1, "name": "Fan 1", "value": "900.0"},
+    ])
+    assert json.dumps(render.temps(health)) == \
+        '[{"id": "0", "temperature": "45.000"}]'
+    assert json.dumps(render.fans(health)) == \
+        '[{"id": "1", "fan_speed": "900.0"}]'
+    assert health.sensors == {0: 45, 1: 900}
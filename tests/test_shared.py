@@ -0,0 +1,70 @@
+"""Snapshots shared between the poller and the workers"""
+# -*- coding:utf-8 -*-
+import asyncio
+
+from shared import SharedSnapshots
+
+
+def test_worker_reads_published_snapshots(tmp_path):
+    poller = SharedSnapshots(str(tmp_path))
+    poller.create(["a"], ["storage"])
+    worker = SharedSnapshots(str(tmp_path))
+    assert worker.changes() == []
+
+    poller.publish("a", "storage", 10.0, {"disk": []})
+    assert worker.changes() == [("a", "storage", 10.0, {"disk": []}, False)]
+    assert worker.changes() == []
+
+
+def test_versions_keep_counting_for_the_same_hosts(tmp_path):
+    poller = SharedSnapshots(str(tmp_path))
+    poller.create(["a"], ["storage"])
+    poller.publish("a", "storage", 10.0, {})
+    poller.close()
+
+    worker = SharedSnapshots(str(tmp_path))
+    assert len(worker.changes()) == 1
+    restarted = SharedSnapshots(str(tmp_path))
+    restarted.create(["a"], ["storage"])
+    assert worker.changes() == []
+
+
+def test_renamed_host_starts_without_versions(tmp_path):
+    poller = SharedSnapshots(str(tmp_path))
+    poller.create(["a"], ["storage"])
+    poller.publish("a", "storage", 10.0, {})
+    worker = SharedSnapshots(str(tmp_path))
+    assert len(worker.changes()) == 1
+    poller.close()
+
+    # Same number of slots, the version of a must not carry over to b
+    # which has no payload yet
+    restarted = SharedSnapshots(str(tmp_path))
+    restarted.create(["b"], ["storage"])
+    assert worker.changes() == []
+    restarted.publish("b", "storage", 20.0, {})
+    assert worker.changes() == [("b", "storage", 20.0, {}, False)]
+
+
+def test_follow_survives_failing_replicas(tmp_path):
+    poller = SharedSnapshots(str(tmp_path))
+    poller.create(["a", "b"], ["storage"])
+    poller.publish("a", "storage", 10.0, {})
+    worker = SharedSnapshots(str(tmp_path))
+    replicated = []
+
+    def replicate(host, group, fetched, raw, stale):
+        if host == "a":
+            raise ValueError("broken snapshot")
+        replicated.append(host)
+
+    async def scenario():
+        follower = asyncio.ensure_future(worker.follow(replicate, 0.01))
+        await asyncio.sleep(0.05)
+        poller.publish("b", "storage", 11.0, {})
+        await asyncio.sleep(0.05)
+        assert not follower.done()
+        follower.cancel()
+
+    asyncio.run(scenario())
+    assert replicated == ["b"]
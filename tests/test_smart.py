@@ -0,0 +1,63 @@
+"""S.M.A.R.T. collection order and disk names"""
+# -*- coding:utf-8 -*-
+import asyncio
+
+from smart import SmartCollector, devicefile
+
+DISKS = ("/dev/sda", "/dev/sdb", "/dev/sdc")
+
+
+class _Storage(object):
+    """Storage snapshot of awake disks that are all GOOD"""
+    disks = DISKS
+
+    def disk_name(self, devicefile):
+        return "WDC WD40EFRX"
+
+    def disk_smart_status(self, devicefile):
+        return "GOOD"
+
+    def disk_temp(self, devicefile):
+        return 35
+
+
+class _Api(object):
+    """Client whose Smart.getAttributes fails for the failing disks"""
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.calls = []
+        self._listeners = []
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def refresh(self):
+        for callback in self._listeners:
+            callback("storage", _Storage())
+
+    async def aget_smart_attributes(self, devicefile):
+        self.calls.append(devicefile)
+        if devicefile in self.failing:
+            raise ValueError("smartctl failed")
+        return [{"id": 194, "rawvalue": "35"}]
+
+
+def test_failing_disk_does_not_take_every_tick():
+    api = _Api(failing=("/dev/sda",))
+    collector = SmartCollector(api, per_tick=1)
+    api.refresh()
+
+    async def ticks():
+        for _ in range(6):
+            await collector.tick()
+
+    asyncio.run(ticks())
+    assert api.calls == list(DISKS) * 2
+    assert collector.attributes("/dev/sda") is None
+    assert collector.attributes("/dev/sdb") is not None
+
+
+def test_disks_are_found_however_the_path_is_spelled():
+    for disk in ("sda", "dev/sda", "/dev/sda", "//dev/sda"):
+        assert devicefile(disk) == "/dev/sda"
+    assert devicefile("disk/by-id/ata-WDC") == "/dev/disk/by-id/ata-WDC"
@@ -0,0 +1,29 @@
+"""Snapshots kept on disk across restarts"""
+# -*- coding:utf-8 -*-
+from snapshots import SnapshotStore
+
+
+def test_latest_saved_snapshot_is_loaded_after_a_restart(tmp_path):
+    path = str(tmp_path / "snapshots.db")
+    store = SnapshotStore(path)
+    store.save("a", "services", 1.0, [{"name": "ssh"}])
+    store.save("a", "services", 2.0, [{"name": "nfs"}])
+    store.save("b", "health", 3.0, [])
+    store.close()
+
+    restarted = SnapshotStore(path)
+    assert restarted.load("a") == {"services": (2.0, [{"name": "nfs"}])}
+    assert restarted.load("b") == {"health": (3.0, [])}
+    restarted.close()
+
+
+def test_unencodable_payload_does_not_stop_the_writer(tmp_path):
+    path = str(tmp_path / "snapshots.db")
+    store = SnapshotStore(path)
+    store.save("a", "storage", 1.0, {"volumes": object()})
+    store.save("a", "health", 2.0, [])
+    store.close()
+
+    restarted = SnapshotStore(path)
+    assert restarted.load("a") == {"health": (2.0, [])}
+    restarted.close()